@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dorfperfekt.solver import SolverEngine  # noqa: E402
+from dorfperfekt.tile import Terrain, Tile, string2tile, terrains2tile  # noqa: E402
+from dorfperfekt.tilemap import InvalidTilePlacementError, TileMap  # noqa: E402
+
+IMPORTS = ["dorfperfekt.tilemap", "dorfperfekt.cli", "dorfperfekt.gui"]
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# mostly grass, like a real game, so that most random placements are valid
+WEIGHTS = {
+    Terrain.GRASS: 8,
+    Terrain.FOREST: 4,
+    Terrain.RANCH: 3,
+    Terrain.DWELLING: 3,
+    Terrain.WATER: 1,
+    Terrain.STATION: 1,
+    Terrain.TRAIN: 1,
+    Terrain.COAST: 1,
+}
+
+
+def random_terrains(rng):
+    terrains = rng.choices(list(WEIGHTS), weights=list(WEIGHTS.values()), k=6)
+    return terrains2tile(tuple(terrains)).terrains
+
+
+def synthetic_map(size, uniques, seed=0):
+    rng = random.Random(seed)
+    kinds = {string2tile("g").terrains}
+    while len(kinds) < uniques:
+        kinds.add(random_terrains(rng))
+
+    kinds = sorted(kinds)
+    tilemap = TileMap()
+    while len(tilemap) < size:
+        pos = rng.choice(sorted(tilemap.open))
+        for _ in range(20):
+            try:
+                tilemap[pos] = Tile(rng.choice(kinds), rng.randrange(6))
+                break
+            except InvalidTilePlacementError:
+                pass
+
+    return tilemap
+
+
+def timed(func, repeat=1):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def bench_map(size, uniques, repeat):
+    tracemalloc.start()
+    tilemap = synthetic_map(size, uniques)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {"open": len(tilemap.open), "build_peak_kib": peak // 1024}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filepath = os.path.join(tmp, "map.txt")
+        results["write_file"] = timed(lambda: tilemap.write_file(filepath), repeat)
+        results["from_file"] = timed(lambda: TileMap.from_file(filepath), repeat)
+
+        filepath = os.path.join(tmp, "map.dorf")
+        write = lambda: tilemap.write_file(filepath, binary=True)  # noqa: E731
+        results["write_binary"] = timed(write, repeat)
+        results["from_binary"] = timed(lambda: TileMap.from_file(filepath), repeat)
+
+    # delete and re-place the most recently placed tiles
+    placed = list(tilemap.tiles.items())[-min(100, size - 1) :]
+
+    def churn():
+        for pos, _ in reversed(placed):
+            del tilemap[pos]
+        for pos, tile in placed:
+            tilemap[pos] = tile
+
+    results["setdel_per_tile"] = timed(churn, repeat) / (2 * len(placed))
+
+    terrains = max(tilemap.counter, key=tilemap.counter.get)
+    with SolverEngine() as engine:
+        results["scores_cold"] = timed(lambda: list(engine.scores(tilemap, terrains)))
+        results["scores_warm"] = timed(
+            lambda: list(engine.scores(tilemap, terrains)), repeat
+        )
+
+    tilemap.batch_scores(terrains)  # first call pays for importing numpy
+    tracemalloc.start()
+    results["batch_scores"] = timed(lambda: tilemap.batch_scores(terrains), repeat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results["batch_peak_kib"] = peak // 1024
+
+    return results
+
+
+def bench_imports(repeat):
+    # each import is timed in a fresh interpreter so nothing is cached
+    code = "import time; t = time.perf_counter(); import {}; "
+    code += "print(time.perf_counter() - t)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    results = {}
+    for module in IMPORTS:
+        times = []
+        for _ in range(repeat):
+            process = subprocess.run(
+                [sys.executable, "-c", code.format(module)],
+                cwd=root,
+                capture_output=True,
+                text=True,
+            )
+            if process.returncode:
+                break
+
+            times.append(float(process.stdout))
+
+        if times:
+            results[module] = min(times)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(name, {}).get(metric)
+            if not reference or metric == "open":
+                continue
+
+            ratio = value / reference
+            flag = " <-- regression" if ratio > tolerance else ""
+            print("{:<12} {:<16} {:8.2f}x{}".format(name, metric, ratio, flag))
+            if flag:
+                regressions.append((name, metric))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dorfperfekt solver benchmarks.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--uniques", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="FILE", nargs="?", const=BASELINE)
+    parser.add_argument("--compare", metavar="FILE", nargs="?", const=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    benches = [("imports", lambda: bench_imports(args.repeat))]
+    for size in args.sizes:
+        name = "{}x{}".format(size, args.uniques)
+        benches.append(
+            (name, lambda size=size: bench_map(size, args.uniques, args.repeat))
+        )
+
+    results = {}
+    for name, bench in benches:
+        results[name] = {key: round(value, 6) for key, value in bench().items()}
+        print(name, json.dumps(results[name]))
+
+    if args.save:
+        with open(args.save, "w") as file:
+            machine = {"python": platform.python_version(), "cpus": os.cpu_count()}
+            json.dump({"machine": machine, "results": results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+
+        if compare(results, baseline, args.tolerance):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+from math import inf
+
+import numpy as np
+
+from .tile import (  # local dorfperfekt imports
+    EDGE_BITS,
+    EDGE_MASK,
+    TERRAIN_CODES,
+    Terrain,
+    Tile,
+    rotate_code,
+    rotational_period,
+    terrains2code,
+    validate_terrains,
+)
+from .tilemap import adjacent_positions
+
+# edge compatibility indexed by [inner terrain code, outer terrain code]
+VALID = np.zeros((EDGE_MASK + 1,) * 2, dtype=bool)
+GOOD = np.zeros((EDGE_MASK + 1,) * 2, dtype=bool)  # valid and not imperfect
+for _inner in Terrain:
+    for _outer in Terrain:
+        _valid, _perfect = validate_terrains(_inner, _outer)
+        _edges = TERRAIN_CODES[_inner], TERRAIN_CODES[_outer]
+        VALID[_edges] = _valid
+        GOOD[_edges] = _valid and _perfect is not False
+
+SHIFTS = np.array([EDGE_BITS * (5 - ori) for ori in range(6)])
+
+# upper bound on the boolean work array built per chunk of rings
+CHUNK_BYTES = 2**25
+
+
+def code2edges(codes):
+    codes = np.asarray(codes, dtype=np.int64).reshape(-1, 1)
+    return (codes >> SHIFTS & EDGE_MASK).astype(np.intp)
+
+
+def rotations(kinds):
+    return code2edges([rotate_code(kind, ori) for kind in kinds for ori in range(6)])
+
+
+def distinct_rotations(kinds):
+    # rotations of each kind up to its rotational period, and the first row of
+    # each kind's rotations
+    periods = [rotational_period(kind) for kind in kinds]
+    codes = [
+        rotate_code(kind, ori)
+        for kind, period in zip(kinds, periods)
+        for ori in range(period)
+    ]
+    return code2edges(codes), np.cumsum([0] + periods[:-1])
+
+
+def perfect_alternates(rings, candidates, starts, weights):
+    # rings: (N, 6) edges, candidates: (R, 6) rotated edges of K kinds, the
+    # rotations of kind k starting at row starts[k], weights: (K,)
+    alternates = np.zeros(len(rings), dtype=np.int64)
+    if not len(weights):
+        return alternates
+
+    step = max(1, CHUNK_BYTES // (6 * len(candidates)))
+    for start in range(0, len(rings), step):
+        chunk = rings[start : start + step]
+        good = GOOD[candidates[None], chunk[:, None, :]].all(axis=-1)
+        fits = np.logical_or.reduceat(good, starts, axis=1)
+        alternates[start : start + step] = fits @ weights
+
+    return alternates
+
+
+def batch_scores(tilemap, terrains, thresh=1, positions=None):
+    positions = list(tilemap.open if positions is None else positions)
+    if not positions:
+        return []
+
+    kind = terrains2code(terrains)
+    placed = rotations([kind])
+
+    # candidate tiles and their weights before and after placing the solved tile
+    kinds = sorted(set(tilemap.kinds) | {kind})
+    counts = np.array([tilemap.kinds[k] for k in kinds])
+    after = counts + np.array([k == kind for k in kinds])
+    weights1 = np.where(counts >= thresh, counts, 0)
+    weights2 = np.where(after >= thresh, after, 0)
+    keep = weights2 > 0
+    candidates, starts = distinct_rotations([k for k, w in zip(kinds, keep) if w])
+    weights1, weights2 = weights1[keep], weights2[keep]
+
+    # outer rings of each position and of each empty adjacent position
+    adjacent = [adjacent_positions(pos) for pos in positions]
+    empties = {
+        adj for adjs in adjacent for adj in adjs if adj not in tilemap.codes
+    }.union(positions)
+    empties = list(empties)
+    index = {pos: idx for idx, pos in enumerate(empties)}
+    if tilemap.grid is None:
+        rings = code2edges([tilemap.outer_code(pos) for pos in empties])
+    else:
+        rings = code2edges(tilemap.grid.outer_codes(empties))
+
+    prows = np.array([index[pos] for pos in positions])
+    prings = rings[prows]  # (P, 6)
+    ruined = np.array(
+        [[adj in tilemap.ruined for adj in adjs] for adjs in adjacent], dtype=bool
+    )
+
+    # first and second terms for every position and orientation
+    valid = VALID[placed[None], prings[:, None, :]].all(axis=-1)  # (P, 6)
+    imperfect = ~GOOD[placed[None], prings[:, None, :]]  # (P, 6, 6)
+    newly_ruined = imperfect.any(axis=-1) + (imperfect & ~ruined[:, None, :]).sum(-1)
+    alternates = perfect_alternates(prings, candidates, starts, weights1)
+
+    # third term: rings of the empty adjacent positions once the tile is placed
+    pidx, ori, edge = np.nonzero(
+        valid[:, :, None]
+        & np.array([[adj in index for adj in adjs] for adjs in adjacent])[:, None]
+    )
+    qrows = np.array(
+        [index.get(adj, -1) for adjs in adjacent for adj in adjs], dtype=np.intp
+    ).reshape(-1, 6)[pidx, edge]
+    modified = rings[qrows]
+    modified[np.arange(len(modified)), (edge + 3) % 6] = placed[ori, edge]
+    unique, inverse = np.unique(modified, axis=0, return_inverse=True)
+    secondorder = np.full(valid.shape, np.inf)
+    if len(unique):
+        found = perfect_alternates(unique, candidates, starts, weights2)
+        found = found[inverse.ravel()]
+        np.minimum.at(secondorder, (pidx, ori), found)
+
+    results = []
+    for p, pos in enumerate(positions):
+        scores = set()
+        for o in np.flatnonzero(valid[p]):
+            second = secondorder[p, o]
+            score = (
+                int(newly_ruined[p, o]),
+                int(alternates[p]),
+                -inf if second == inf else -int(second),
+            )
+            scores.add((score, Tile(terrains, int(o))))
+
+        results.append((pos, scores))
+
+    return results
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import sys
+from math import isinf
+
+from .solver import BACKENDS, SolverEngine  # local dorfperfekt imports
+from .tile import (
+    InvalidTileDefinitionError,
+    rotational_period,
+    string2tile,
+    terrains2code,
+    tile2string,
+)
+from .tilemap import InvalidTilePlacementError, TileMap
+
+
+def format_score(pos, score, tile):
+    return json.dumps(
+        {
+            "pos": list(pos),
+            "rotation": tile.ori,
+            "tile": tile2string(tile),
+            "score": [None if isinf(term) else term for term in score],
+        }
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="dorfperfekt-solve",
+        description="Rank the placements of a tile on a saved map as JSON lines.",
+    )
+    parser.add_argument("mapfile", help="map saved by dorfperfekt")
+    parser.add_argument("tile", help="six-character tile definition string")
+    parser.add_argument("--thresh", type=int, default=1, help="tile counter threshold")
+    parser.add_argument("--top", type=int, help="only solve for the best placements")
+    parser.add_argument(
+        "--focus",
+        type=int,
+        nargs=2,
+        metavar=("X", "Y"),
+        help="solve the positions nearest this one first",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="process",
+        help="run the solver in worker processes, threads or serially",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="number of worker processes or threads"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print where the solve spent its time to stderr",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="print placements as positions are solved instead of ranked",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        tile = string2tile(args.tile)
+    except InvalidTileDefinitionError:
+        parser.error("invalid tile definition string: " + args.tile)
+
+    try:
+        tilemap = TileMap.from_file(args.mapfile)
+    except OSError as error:
+        parser.error("could not read {}: {}".format(args.mapfile, error.strerror))
+    except (
+        InvalidTileDefinitionError,
+        InvalidTilePlacementError,
+        UnicodeDecodeError,
+    ) as error:
+        parser.error("could not open {}: {}".format(args.mapfile, error))
+
+    if args.thresh < 1:
+        parser.error("--thresh must be at least 1")
+
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if args.top is not None and args.top < 1:
+        parser.error("--top must be at least 1")
+
+    if args.top is not None and args.stream:
+        parser.error("--top cannot be used with --stream, which does not rank")
+
+    engine = SolverEngine(args.workers, backend=args.backend, profile=args.profile)
+    try:
+        with engine:
+            focus = None if args.focus is None else tuple(args.focus)
+            # the orientations repeated by a symmetric tile are the same placement
+            period = rotational_period(terrains2code(tile.terrains))
+            scores = tilemap.scores(tile.terrains, args.thresh, engine, focus, args.top)
+            ranked = []
+            for pos, tilescores in scores:
+                for score, solved in sorted(tilescores):
+                    if solved.ori >= period:
+                        continue
+                    if args.stream:
+                        print(format_score(pos, score, solved), flush=True)
+                    else:
+                        ranked.append((score, pos, solved.ori, solved))
+
+        if args.profile:
+            print(engine.stats.report(), file=sys.stderr)
+
+        for score, pos, _, solved in sorted(ranked)[: args.top]:
+            print(format_score(pos, score, solved))
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # the reader stopped early, as head does, and stdout is flushed again at
+        # exit: point it at devnull so that flush does not fail as well
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
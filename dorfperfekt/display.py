@@ -1,6 +1,9 @@
+from collections import defaultdict
+from math import floor
+
 import numpy as np
-from matplotlib.colors import LinearSegmentedColormap
-from matplotlib.patches import Polygon
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import LinearSegmentedColormap, to_rgba, to_rgba_array
 
 from dorfperfekt.tile import Terrain
 
@@ -14,6 +17,11 @@ XVEC = np.array([0, 1])
 YVEC = np.array([DIST, np.sin(np.deg2rad(30))])
 VERTICES = np.transpose(np.vstack((np.cos(angles), np.sin(angles))))
 
+# one hexagon, or six triangles running clockwise, around a position's center
+HEXAGON = VERTICES[None]
+_corners = np.flipud(np.vstack((VERTICES, VERTICES[0])))
+TRIANGLES = np.array([[(0, 0), _corners[k], _corners[k + 1]] for k in range(6)])
+
 TERRAIN_COLORS = {
     Terrain.GRASS: "lightgreen",
     Terrain.FOREST: "darkgreen",
@@ -36,58 +44,178 @@ def coords2pos(coords):
     return tuple([int(np.rint(p)) for p in pos])
 
 
-def format_map(draw_map):
-    def wrapper(*args, **kwargs):
-        ax = kwargs["ax"] if "ax" in kwargs else args[0]
-        [p.remove() for p in reversed(ax.patches)]
-        draw_map(*args, **kwargs)
-
-    return wrapper
-
-
-@format_map
-def draw_position_map(ax, nonruined, ruined, ranked=[], unranked=[]):
-    xlim, ylim = ax.get_xlim(), ax.get_ylim()
-
-    def draw_tile(pos, color, edge):
-        coords = pos2coords(pos)
-        inx = (xlim[0] - 1) <= coords[0] <= (xlim[1] + 1)
-        iny = (ylim[0] - 1) <= coords[1] <= (ylim[1] + 1)
-
-        if inx and iny:
-            corners = coords + VERTICES
-            patch = Polygon(corners, edgecolor=edge, facecolor=color)
-            ax.add_patch(patch)
-
-    color = CMAP(np.linspace(0, 1, len(ranked)))
-
-    [draw_tile(pos, "lightslategrey", "white") for pos in nonruined]
-    [draw_tile(pos, "lightsteelblue", "white") for pos in ruined]
-
-    for idx, pset in enumerate(ranked):
-        for pos in pset:
-            draw_tile(pos, color[idx], "black")
-
-    [draw_tile(pos, "white", "black") for pos in unranked]
-
-
-@format_map
-def draw_terrain_map(ax, tiles, selected):
-    xlim, ylim = ax.get_xlim(), ax.get_ylim()
-
-    for pos, tile in tiles:
-        coords = pos2coords(pos)
-        inx = (xlim[0] - 1) <= coords[0] <= (xlim[1] + 1)
-        iny = (ylim[0] - 1) <= coords[1] <= (ylim[1] + 1)
-
-        if inx and iny:
-            corners = coords + VERTICES
-            corners = np.vstack((corners, corners[0]))
-            corners = np.flipud(corners)
-            color = "black" if (pos, tile) == selected else None
-
-            for k in range(len(corners) - 1):
-                tcolor = TERRAIN_COLORS[tile.terrains[(k + 2 - tile.ori) % 6]]
-                subpatch_corners = [coords, corners[k], corners[k + 1]]
-                subpatch = Polygon(subpatch_corners, edgecolor=color, facecolor=tcolor)
-                ax.add_patch(subpatch)
+def rescale_axes(fig, ax, origin, scale):
+    extent = fig.get_window_extent()
+    coords = pos2coords(origin)
+    scale = scale * 3 / 4
+    ascale = scale * extent.height / extent.width
+    ax.set_xlim(coords[0] - scale, coords[0] + scale)
+    ax.set_ylim(coords[1] - ascale, coords[1] + ascale)
+
+
+# Positions bucketed by the square of the plot their center falls in, so that
+# the positions within view are found without looking at all of them.
+class SpatialIndex:
+    def __init__(self, size=8.0):
+        self.size = size
+        self.buckets = defaultdict(set)
+        self.coords = dict()
+
+    def bucket(self, coords):
+        return floor(coords[0] / self.size), floor(coords[1] / self.size)
+
+    def add(self, pos):
+        # pos2coords without numpy, which is slow on a single position
+        x, y = pos
+        coords = self.coords[pos] = (2 * DIST * DIST * y, 2 * DIST * (x + y / 2))
+        self.buckets[self.bucket(coords)].add(pos)
+
+    def remove(self, pos):
+        bucket = self.bucket(self.coords.pop(pos))
+        self.buckets[bucket].discard(pos)
+        if not self.buckets[bucket]:
+            del self.buckets[bucket]
+
+    def within(self, pos, xlim, ylim, margin=1):
+        x, y = self.coords[pos]
+        return (
+            xlim[0] - margin <= x <= xlim[1] + margin
+            and ylim[0] - margin <= y <= ylim[1] + margin
+        )
+
+    def query(self, xlim, ylim, margin=1):
+        x0, y0 = self.bucket((xlim[0] - margin, ylim[0] - margin))
+        x1, y1 = self.bucket((xlim[1] + margin, ylim[1] + margin))
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(self.buckets):
+            buckets = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+        else:  # zoomed far out, fewer buckets in use than under the view
+            buckets = [
+                (x, y) for x, y in self.buckets if x0 <= x <= x1 and y0 <= y <= y1
+            ]
+
+        return [
+            pos
+            for bucket in buckets
+            for pos in self.buckets.get(bucket, ())
+            if self.within(pos, xlim, ylim, margin)
+        ]
+
+
+# One PolyCollection holding the shapes drawn around every position in view.
+# Positions are given a style, a tuple whose first item is the drawing order;
+# updates only repaint the positions whose style changed, unless positions come
+# into or drop out of view, or the view itself moves.
+class HexLayer:
+    def __init__(self, ax, shapes, paint):
+        self.ax = ax
+        self.shapes = shapes
+        self.paint = paint  # style -> face colors of the shapes and edge color
+        self.paints = dict()
+        self.styles = dict()
+        self.index = SpatialIndex()
+        self.viewport = None
+        self.rows = dict()  # position in view -> index of its first shape
+        self.faces = np.zeros((0, 4))
+        self.edges = np.zeros((0, 4))
+        self.collection = PolyCollection([], linewidths=1)
+        ax.add_collection(self.collection)
+
+    def update(self, styles):
+        old = self.styles
+        added = styles.keys() - old.keys()
+        removed = old.keys() - styles.keys()
+        changed = [pos for pos in styles.keys() & old.keys() if styles[pos] != old[pos]]
+
+        for pos in removed:
+            self.index.remove(pos)
+        for pos in added:
+            self.index.add(pos)
+        self.styles = dict(styles)
+
+        viewport = tuple(self.ax.get_xlim()), tuple(self.ax.get_ylim())
+        if (
+            viewport != self.viewport
+            or any(pos in self.rows for pos in removed)
+            or any(self.index.within(pos, *viewport) for pos in added)
+            or any(styles[pos][0] != old[pos][0] for pos in changed if pos in self.rows)
+        ):
+            self.rebuild(viewport)
+            return
+
+        count = len(self.shapes)
+        for pos in changed:
+            if pos in self.rows:
+                row = self.rows[pos]
+                faces, edge = self.painted(styles[pos])
+                self.faces[row : row + count] = faces
+                self.edges[row : row + count] = edge
+
+        if changed:
+            self.collection.set_facecolor(self.faces)
+            self.collection.set_edgecolor(self.edges)
+
+    def rebuild(self, viewport):
+        visible = self.index.query(*viewport)
+        visible.sort(key=lambda pos: self.styles[pos][0])
+        count = len(self.shapes)
+        self.viewport = viewport
+        self.rows = {pos: row * count for row, pos in enumerate(visible)}
+
+        coords = pos2coords(np.array(visible).reshape(-1, 2))
+        verts = coords[:, None, None, :] + self.shapes[None]
+        self.collection.set_verts(verts.reshape(-1, *self.shapes.shape[1:]))
+
+        paints = [self.painted(self.styles[pos]) for pos in visible]
+        self.faces = np.concatenate([faces for faces, _ in paints] or [self.faces[:0]])
+        self.edges = np.repeat([edge for _, edge in paints], count, axis=0)
+        self.edges = self.edges.reshape(-1, 4)
+        self.collection.set_facecolor(self.faces)
+        self.collection.set_edgecolor(self.edges)
+
+    def painted(self, style):
+        try:
+            return self.paints[style]
+        except KeyError:
+            faces, edge = self.paint(style)
+            self.paints[style] = faces, edge = np.array(faces), np.array(edge)
+            return faces, edge
+
+
+def paint_position(style):
+    _, face, edge = style
+    return to_rgba_array([face]), to_rgba(edge)
+
+
+def paint_terrain(style):
+    selected, tile = style
+    faces = [TERRAIN_COLORS[tile.terrains[(k + 2 - tile.ori) % 6]] for k in range(6)]
+    edge = "black" if selected else (0, 0, 0, 0)
+    return to_rgba_array(faces), to_rgba(edge)
+
+
+class PositionMap(HexLayer):
+    def __init__(self, ax):
+        super().__init__(ax, HEXAGON, paint_position)
+
+    def draw(self, nonruined, ruined, ranked=[], unranked=[]):
+        color = [tuple(rgba) for rgba in CMAP(np.linspace(0, 1, len(ranked)))]
+
+        styles = {pos: (0, "lightslategrey", "white") for pos in nonruined}
+        styles.update({pos: (1, "lightsteelblue", "white") for pos in ruined})
+        for idx, pset in enumerate(ranked):
+            styles.update({pos: (2, color[idx], "black") for pos in pset})
+        styles.update({pos: (3, "white", "black") for pos in unranked})
+
+        self.update(styles)
+
+
+class TerrainMap(HexLayer):
+    def __init__(self, ax):
+        super().__init__(ax, TRIANGLES, paint_terrain)
+
+    def draw(self, tiles, selected):
+        styles = {pos: (False, tile) for pos, tile in tiles}
+        if selected is not None:
+            styles[selected[0]] = (True, selected[1])
+
+        self.update(styles)
@@ -0,0 +1,70 @@
+import numpy as np
+
+from .tile import EDGE_BITS, EDGE_MASK, OPEN_RING  # local dorfperfekt imports
+from .tilemap import OFFSETS
+
+
+# Dense storage of placed tile codes over a bounding box of positions, indexed
+# by [x - origin x, y - origin y]. Empty cells hold OPEN_RING, so rings read off
+# the grid see open edges there. The box keeps a margin around every tile set,
+# wide enough to read the rings of the positions up to two steps away.
+class CodeGrid:
+    def __init__(self, margin=3):
+        self.margin = margin
+        self.origin = (0, 0)
+        self.array = np.full((0, 0), OPEN_RING, dtype=np.uint32)
+
+    def __getitem__(self, pos):
+        x, y = self.index(pos)
+        width, height = self.array.shape
+        if 0 <= x < width and 0 <= y < height:
+            return int(self.array[x, y])
+
+        return OPEN_RING
+
+    def __setitem__(self, pos, code):
+        self.reserve(pos)
+        self.array[self.index(pos)] = code
+
+    def __delitem__(self, pos):
+        self.array[self.index(pos)] = OPEN_RING
+
+    def index(self, pos):
+        return pos[0] - self.origin[0], pos[1] - self.origin[1]
+
+    def reserve(self, pos):
+        (x0, y0), (width, height) = self.origin, self.array.shape
+        x, y, margin = pos[0], pos[1], self.margin
+        grow = [
+            max(0, x0 - (x - margin)),
+            max(0, x + margin + 1 - (x0 + width)),
+            max(0, y0 - (y - margin)),
+            max(0, y + margin + 1 - (y0 + height)),
+        ]
+        if not any(grow):
+            return
+
+        # sides that need room grow by at least the current size, so that the
+        # copies are amortised as the map spreads
+        left, right = [side and max(side, width) for side in grow[:2]]
+        down, up = [side and max(side, height) for side in grow[2:]]
+        array = np.full(
+            (width + left + right, height + down + up), OPEN_RING, dtype=np.uint32
+        )
+        array[left : left + width, down : down + height] = self.array
+        self.array = array
+        self.origin = (x0 - left, y0 - down)
+
+    def outer_codes(self, positions):
+        # vectorized TileMap.outer_code, for positions two steps from a tile
+        idx = np.asarray(positions, dtype=np.intp).reshape(-1, 2) - self.origin
+        if ((idx < 1) | (idx >= np.array(self.array.shape) - 1)).any():
+            raise IndexError("position outside of the grid margin")
+
+        rings = np.zeros(len(idx), dtype=np.int64)
+        for ori, (dx, dy) in enumerate(OFFSETS):
+            adj = self.array[idx[:, 0] + dx, idx[:, 1] + dy].astype(np.int64)
+            edge = adj >> EDGE_BITS * (5 - (ori + 3) % 6) & EDGE_MASK
+            rings |= edge << EDGE_BITS * (5 - ori)
+
+        return rings
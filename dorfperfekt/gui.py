@@ -0,0 +1,614 @@
+import os
+import sys
+import time
+from collections import defaultdict
+from functools import partial
+
+from PySide6.QtCore import QObject, QThread, QTimer, Signal, Slot
+from PySide6.QtWidgets import (
+    QApplication,
+    QComboBox,
+    QFileDialog,
+    QGridLayout,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QMainWindow,
+    QMessageBox,
+    QProgressBar,
+    QPushButton,
+    QSizePolicy,
+    QSpinBox,
+    QVBoxLayout,
+    QWidget,
+)
+
+from .journal import Journal, journal_path
+from .solver import BACKENDS, SolverEngine
+from .tile import InvalidTileDefinitionError, string2tile
+from .tilemap import InvalidTilePlacementError, TileMap
+
+FILE_FILTERS = ["Text map (*.txt)", "Binary map (*.dorf)"]
+
+StyleSheet = """
+#BlueProgressBar {
+    text-align: center;
+    border: 2px solid #2196F3;
+    border-radius: 5px;
+    background-color: #E0E0E0;
+}
+#BlueProgressBar::chunk {
+    background-color: #2196F3;
+    width: 10px; 
+    margin: 0.5px;
+}
+"""
+
+# results cross to the gui thread in batches, at least this often while solving
+BATCH_SECONDS = 0.05
+BATCH_SIZE = 512
+REDRAW_MSEC = 250
+
+
+class Solver(QObject):
+    results = Signal(tuple)  # the solve's number, see MainWindow.solve, and a batch
+    staged = Signal(int)  # number of score terms of a stage that has finished
+    report = Signal(str)
+
+    def __init__(self, parent=None, **kwargs):
+        super(Solver, self).__init__(parent, **kwargs)
+        self.engine = SolverEngine(incremental=True)
+        self.latest = 0  # number of the latest solve asked for, see interrupt
+
+    @Slot(str)
+    def set_backend(self, backend):
+        self.engine.close()
+        self.engine = SolverEngine(incremental=True, backend=backend)
+
+    def interrupt(self, latest=None):
+        # safe from the gui thread, the running solve stops at its next result;
+        # given the number of the solve to come, queued earlier ones never start
+        if latest is not None:
+            self.latest = latest
+        self.engine.cancel()
+
+    @Slot(tuple)
+    def run(self, msg):
+        solve, tilemap, terrains, thresh, focus = msg
+        if solve < self.latest:
+            return
+
+        generation = self.engine.generation.value
+        terms = None
+        batch = []
+        deadline = time.monotonic() + BATCH_SECONDS
+        # a partial batch is passed on before the engine waits on its workers
+        waiting = partial(self.flush, solve, batch)
+        scores = self.engine.staged_scores(
+            tilemap, terrains, thresh, focus, waiting=waiting
+        )
+        for result in scores:
+            if solve < self.latest:  # its cancel may have come before it started
+                return
+
+            if terms is not None and terms != result[0]:
+                self.flush(solve, batch)
+                self.staged.emit(terms)
+            terms = result[0]
+            batch.append(result)
+            if len(batch) >= BATCH_SIZE or time.monotonic() >= deadline:
+                self.flush(solve, batch)
+                deadline = time.monotonic() + BATCH_SECONDS
+
+        if terms is not None and self.engine.generation.value == generation:
+            self.flush(solve, batch)
+            self.staged.emit(terms)
+            self.report.emit(self.engine.stats.summary())
+
+    def flush(self, solve, batch):
+        if batch:
+            self.results.emit((solve, batch[:]))
+            batch.clear()
+
+
+class MainWindow(QMainWindow):
+    run_solver = Signal(tuple)
+    change_backend = Signal(str)
+
+    def __init__(self):
+        QMainWindow.__init__(self)
+        self.setMinimumSize(500, 500)
+
+        self.filename = None
+        self.binary = False
+        self.tilemap = TileMap()
+        self.journal = Journal(self.tilemap)
+        self.pos_focus = (0, 0)
+        self.ter_focus = (0, 0)
+        self.scores = dict()
+        self.solves = 0  # numbers the solves, results of earlier ones are dropped
+        self.tile2solve = None
+        self.tile2place = None
+
+        self.init_menu_bar()
+        self.init_window_title()
+
+        # setup top-level layouts
+        main_vbox = QVBoxLayout()
+        main_hbox = QHBoxLayout()
+        side_vbox = QVBoxLayout()
+        main_vbox.addLayout(main_hbox)
+        main_hbox.addLayout(side_vbox)
+
+        central = QWidget(self)
+        central.setLayout(main_vbox)
+        self.setCentralWidget(central)
+
+        # setup top-level widgets, plots follow once the window is shown
+        self.init_controls(side_vbox)
+        self.pgbar = self.init_progress_bar(main_vbox)
+        self.terfg = self.terax = self.tercv = None
+        self.posfg = self.posax = self.poscv = None
+        QTimer.singleShot(0, lambda: self.init_plots(side_vbox, main_hbox))
+
+        # setup solver thread
+        self.thread = QThread()
+        self.solver = Solver()
+        self.solver.results.connect(self.update_scores)
+        self.solver.staged.connect(self.draw_position_map)
+        self.solver.report.connect(self.statusBar().showMessage)
+        self.run_solver.connect(self.solver.run)
+        self.change_backend.connect(self.solver.set_backend)
+        self.solver.moveToThread(self.thread)
+        self.thread.start(priority=QThread.Priority.IdlePriority)
+
+        # setup resize event timer
+        self.rtimer = QTimer()
+        self.rtimer.setSingleShot(True)
+        self.rtimer.timeout.connect(self.resized)
+
+        # setup position map redraw timer, for scores arriving while solving
+        self.dtimer = QTimer()
+        self.dtimer.setSingleShot(True)
+        self.dtimer.timeout.connect(self.draw_position_map)
+
+    def init_window_title(self):
+        filestring = " (" + self.filename + ")" if self.filename is not None else ""
+        self.setWindowTitle("Dorfperfekt" + filestring + "[*]")
+
+    def init_menu_bar(self):
+        menu = self.menuBar()
+        file_menu = menu.addMenu("File")
+
+        open_action = file_menu.addAction("Open...")
+        open_action.triggered.connect(self.open)
+
+        save_action = file_menu.addAction("Save")
+        save_action.setShortcut("Ctrl+S")
+        save_action.triggered.connect(self.save)
+
+        saveas_action = file_menu.addAction("Save as...")
+        saveas_action.triggered.connect(self.saveas)
+
+        edit_menu = menu.addMenu("Edit")
+
+        undo_action = edit_menu.addAction("Undo")
+        undo_action.setShortcut("Ctrl+Z")
+        undo_action.triggered.connect(self.undo)
+
+        redo_action = edit_menu.addAction("Redo")
+        redo_action.setShortcut("Ctrl+Y")
+        redo_action.triggered.connect(self.redo)
+
+    def init_plots(self, side_vbox, main_hbox):
+        from .display import PositionMap, TerrainMap
+
+        self.terfg, self.terax, self.tercv = self.init_plot_canvas(side_vbox)
+        self.tercv.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Expanding)
+        self.posfg, self.posax, self.poscv = self.init_plot_canvas(main_hbox)
+        self.terrain_map = TerrainMap(self.terax)
+        self.position_map = PositionMap(self.posax)
+        self.poscv.callbacks.connect("button_press_event", self.focus)
+        self.resized()
+
+    def init_plot_canvas(self, parent):
+        # matplotlib is slow to import, keep it off the startup path
+        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+
+        fig = Figure()
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.axis("off")
+        canvas = FigureCanvas(fig)
+        parent.addWidget(canvas, stretch=1)
+
+        return fig, ax, canvas
+
+    def init_controls(self, parent):
+        grid = QGridLayout()
+
+        grid.addWidget(QLabel("Position Map Horizontal Scale :"), 0, 0, 1, 2)
+        grid.addWidget(possc := QSpinBox(minimum=10), 0, 2)
+        grid.addWidget(QLabel("Terrain Map Horizontal Scale :"), 1, 0, 1, 2)
+        grid.addWidget(tersc := QSpinBox(minimum=5), 1, 2)
+
+        grid.addWidget(set_origin := QPushButton("Set Origin"), 2, 0)
+        grid.addWidget(rst_origin := QPushButton("Reset Origin"), 2, 1)
+        grid.addWidget(refresh := QPushButton("Refresh"), 2, 2)
+
+        grid.addWidget(QLabel("Tile Definition String :"), 3, 0, 1, 2)
+        grid.addWidget(ledit := QLineEdit(), 3, 2)
+        ledit.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Preferred)
+        grid.addWidget(QLabel("Tile Counter Threshold :"), 4, 0, 1, 2)
+        grid.addWidget(thresh := QSpinBox(minimum=1), 4, 2)
+
+        grid.addWidget(QLabel("Solver Backend :"), 5, 0, 1, 2)
+        grid.addWidget(backend := QComboBox(), 5, 2)
+        backend.addItems(BACKENDS)
+
+        grid.addWidget(solve := QPushButton("Solve"), 6, 0, 1, 3)
+        grid.addWidget(delete := QPushButton("Delete"), 7, 0)
+        grid.addWidget(rotate := QPushButton("Rotate"), 7, 1)
+        grid.addWidget(place := QPushButton("Place"), 7, 2)
+
+        grid.addWidget(total := QLabel(), 8, 0, 1, 3)
+        grid.addWidget(cover := QLabel(), 9, 0, 1, 3)
+
+        possc.valueChanged.connect(self.draw_position_map)
+        tersc.valueChanged.connect(self.draw_terrain_map)
+        refresh.clicked.connect(self.draw_position_map)
+        set_origin.clicked.connect(lambda: self.change_origin(self.ter_focus))
+        rst_origin.clicked.connect(lambda: self.change_origin((0, 0)))
+
+        backend.currentTextChanged.connect(self.set_backend)
+        solve.clicked.connect(self.solve)
+        place.clicked.connect(self.place)
+        rotate.clicked.connect(self.rotate)
+        delete.clicked.connect(self.delete)
+
+        parent.addLayout(grid)
+
+        self.possc = possc
+        self.tersc = tersc
+        self.ledit = ledit
+        self.thresh = thresh
+        self.total = total
+        self.cover = cover
+
+    def init_progress_bar(self, parent):
+        pgbar = QProgressBar(self, objectName="BlueProgressBar")
+        parent.addWidget(pgbar)
+        return pgbar
+
+    def closeEvent(self, event):
+        if self.isWindowModified():
+            ret = QMessageBox.warning(
+                self,
+                "Dorfperfekt -- Warning",
+                "Current file is not saved!",
+                QMessageBox.Ok | QMessageBox.Cancel,
+            )
+            if ret is QMessageBox.Cancel:
+                event.ignore()
+                return
+
+        self.journal.discard()
+        self.solver.interrupt()
+        self.thread.quit()
+        self.thread.wait()
+        self.solver.engine.close()
+        event.accept()
+
+    def resizeEvent(self, event):
+        self.rtimer.start(500)
+        event.accept()
+
+    def resized(self):
+        self.draw_position_map()
+        self.draw_terrain_map()
+
+    def reset(self, modified=False):
+        self.solves += 1
+        self.solver.interrupt(self.solves)
+        self.dtimer.stop()
+        self.scores = dict()
+        self.tile2solve = None
+        self.tile2place = None
+        self.resized()
+        self.setWindowModified(modified)
+        self.ledit.setText("")
+        self.pgbar.setValue(0)
+
+        fstring = "{placed:d} placed. {ruined:d} ruined. {unique:d} unique."
+        self.total.setText(
+            fstring.format(
+                placed=len(self.tilemap),
+                ruined=len(self.tilemap.ruined),
+                unique=len(self.tilemap.counter),
+            )
+        )
+
+        self.cover.setText("")
+
+    def change_origin(self, origin):
+        self.pos_focus = origin
+        self.ter_focus = origin
+        self.tile2place = None
+        self.resized()
+
+    def draw_position_map(self):
+        if self.poscv is None:
+            return
+
+        from .display import rescale_axes
+
+        ruined = set(self.tilemap.ruined)
+        nonruined = set(self.tilemap) - ruined
+
+        # while stages finish, positions are ranked by the terms all scores have
+        terms = min(
+            (
+                len(score)
+                for tilescores in self.scores.values()
+                if tilescores is not None
+                for score, _ in tilescores
+            ),
+            default=None,
+        )
+
+        ranked = defaultdict(set)
+        unranked = set()
+        for pos, tilescores in self.scores.items():
+            if tilescores is None:
+                unranked.add(pos)
+            else:
+                score = min(score[:terms] for score, _ in tilescores)
+                ranked[score].add(pos)
+
+        ranked = [ranked[score] for score in sorted(ranked)]
+
+        rescale_axes(
+            fig=self.posfg,
+            ax=self.posax,
+            origin=self.pos_focus,
+            scale=self.possc.value(),
+        )
+
+        self.position_map.draw(nonruined, ruined, ranked, unranked)
+
+        self.poscv.draw()
+        self.poscv.flush_events()
+
+    def draw_terrain_map(self):
+        if self.tercv is None:
+            return
+
+        from .display import rescale_axes
+
+        tiles = list(self.tilemap.items())
+        if self.tile2place is not None:
+            selected = (self.ter_focus, self.tile2place)
+            tiles.append(selected)
+        else:
+            selected = None
+
+        rescale_axes(
+            fig=self.terfg,
+            ax=self.terax,
+            origin=self.ter_focus,
+            scale=self.tersc.value(),
+        )
+
+        self.terrain_map.draw(tiles, selected)
+
+        self.tercv.draw()
+        self.tercv.flush_events()
+
+    def focus(self, event):
+        from .display import coords2pos
+
+        if event.inaxes is not None:
+            self.ter_focus = coords2pos((event.xdata, event.ydata))
+
+            if self.ter_focus in self.tilemap:
+                # focus position is an existing tile
+                self.tile2place = self.tilemap[self.ter_focus]
+
+            elif self.ter_focus in self.scores:
+                # focus position is an open position
+                tilescores = self.scores[self.ter_focus]
+
+                if tilescores is None:
+                    # focus position has not been scored, use default
+                    self.tile2place = self.tile2solve
+                else:
+                    # focus position has been scored, get best score
+                    scores, tiles = zip(*tilescores)
+                    idx = scores.index(min(scores))
+                    self.tile2place = tiles[idx]
+
+            else:
+                # focus position is not a valid tile
+                self.tile2place = None
+
+            self.draw_terrain_map()
+
+    def open(self):
+        if self.isWindowModified():
+            ret = QMessageBox.warning(
+                self,
+                "Dorfperfekt -- Warning",
+                "Current file is not saved!",
+                QMessageBox.Ok | QMessageBox.Cancel,
+            )
+            if ret is QMessageBox.Cancel:
+                return
+
+        filters = ";;".join(["All files (*)"] + FILE_FILTERS)
+        filename = QFileDialog.getOpenFileName(self, filter=filters)[0]
+        if filename:
+            try:
+                self.tilemap = TileMap.from_file(filename)
+            except (
+                OSError,
+                InvalidTileDefinitionError,
+                InvalidTilePlacementError,
+            ) as error:
+                QMessageBox.warning(
+                    self,
+                    "Dorfperfekt -- Warning",
+                    "Could not open {}\n{}".format(filename, error),
+                )
+                return
+
+            self.journal.discard()
+            self.journal = self.recover(filename)
+            self.filename = filename
+            self.binary = TileMap.is_binary_file(filename)
+            self.init_window_title()
+            self.reset(modified=bool(self.journal.done or self.journal.undone))
+
+    def recover(self, filename):
+        filepath = journal_path(filename)
+        if not os.path.exists(filepath) or not os.path.getsize(filepath):
+            return Journal(self.tilemap, filepath)
+
+        ret = QMessageBox.question(
+            self,
+            "Dorfperfekt -- Recover",
+            "Unsaved moves were found for {}. Recover them?".format(filename),
+        )
+        if ret == QMessageBox.Yes:
+            try:
+                return Journal.recover(self.tilemap, filepath)
+            except (InvalidTileDefinitionError, InvalidTilePlacementError) as error:
+                QMessageBox.warning(
+                    self,
+                    "Dorfperfekt -- Warning",
+                    "Could not recover {}\n{}".format(filepath, error),
+                )
+                self.tilemap = TileMap.from_file(filename)
+
+        journal = Journal(self.tilemap, filepath)
+        journal.discard()
+        return journal
+
+    def save(self):
+        if not self.isWindowModified():
+            return
+        elif self.filename is None:
+            self.saveas()
+        else:
+            self.tilemap.write_file(self.filename, binary=self.binary)
+            self.journal.checkpoint()
+            self.setWindowModified(False)
+
+    def saveas(self):
+        filename, selected = QFileDialog.getSaveFileName(
+            self, filter=";;".join(FILE_FILTERS)
+        )
+        if filename:
+            binary = selected == FILE_FILTERS[1] or filename.endswith(".dorf")
+            self.tilemap.write_file(filename, binary=binary)
+            self.journal.checkpoint(journal_path(filename))
+            self.filename = filename
+            self.binary = binary
+            self.init_window_title()
+            self.setWindowModified(False)
+
+    def solve(self):
+        try:
+            string = self.ledit.text()
+            self.tile2solve = string2tile(string)
+        except InvalidTileDefinitionError:
+            return
+
+        cov = len(
+            [
+                tile
+                for tile, count in self.tilemap.counter.items()
+                if count >= self.thresh.value()
+            ]
+        )
+        self.cover.setText("Solver considering {:d} unique tiles.".format(cov))
+
+        tilemap = self.tilemap.copy()  # the map may change while it is solved
+        self.pgbar.setMaximum(len(tilemap.open))
+        self.scores = {pos: None for pos in tilemap.open}
+        self.solves += 1
+        self.solver.interrupt(self.solves)
+        self.run_solver.emit(
+            (
+                self.solves,
+                tilemap,
+                self.tile2solve.terrains,
+                self.thresh.value(),
+                self.ter_focus,
+            )
+        )
+        self.progress = 0
+        self.pgbar.setValue(0)
+
+    def set_backend(self, backend):
+        # the solver thread swaps engines once any running solve has stopped
+        self.solver.interrupt()
+        self.change_backend.emit(backend)
+
+    def update_scores(self, msg):
+        solve, batch = msg
+        if solve != self.solves:  # interrupted since, by a move or a new solve
+            return
+
+        # partial scores first arrive for every position, then full ones
+        for terms, pos, tilescores in batch:
+            if tilescores:
+                self.scores[pos] = tilescores
+            else:
+                self.scores.pop(pos, None)
+
+            if terms == 3:
+                self.progress += 1
+
+        self.pgbar.setValue(self.progress)
+        if not self.dtimer.isActive():
+            self.dtimer.start(REDRAW_MSEC)
+
+    def place(self):
+        if self.tile2place is not None and self.ter_focus not in self.tilemap:
+            try:
+                self.journal.place(self.ter_focus, self.tile2place)
+                self.reset(modified=True)
+            except InvalidTilePlacementError:
+                pass
+
+    def rotate(self):
+        if self.tile2place is not None and self.ter_focus not in self.tilemap:
+            newori = (self.tile2place.ori + 1) % 6
+            self.tile2place = self.tile2place._replace(ori=newori)
+            self.draw_terrain_map()
+
+    def delete(self):
+        if self.tile2place is not None and self.ter_focus in self.tilemap:
+            self.journal.delete(self.ter_focus)
+            self.reset(modified=True)
+
+    def undo(self):
+        if self.journal.undo():
+            self.reset(modified=True)
+
+    def redo(self):
+        if self.journal.redo():
+            self.reset(modified=True)
+
+
+def main():
+    app = QApplication(sys.argv)
+    app.setStyleSheet(StyleSheet)
+    main_window = MainWindow()
+    main_window.show()
+    main_window.reset()
+    sys.exit(app.exec())
+
+
+if __name__ == "__main__":
+    main()
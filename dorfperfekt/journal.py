@@ -0,0 +1,144 @@
+import os
+import re
+
+from .tile import InvalidTileDefinitionError, string2tile, tile2string
+from .tilemap import InvalidTilePlacementError
+
+JOURNAL_SUFFIX = ".journal"
+
+# one move per line: optional undo/redo prefix, place or delete, then the tile
+# and its position as in the text map format
+RECORD_PATTERN = re.compile(r"^([ur]?)([+-]) ([GFRDWSTC]{6}) (-?\d+) (-?\d+)$")
+
+
+def journal_path(filepath):
+    return filepath + JOURNAL_SUFFIX
+
+
+def inverse(op):
+    action, pos, tile = op
+    return ("-" if action == "+" else "+"), pos, tile
+
+
+# Moves made through the journal are applied to the tilemap and then appended to
+# the journal file, so that the moves made since the map was last saved can be
+# replayed onto it after a crash. Undos and redos are recorded as the move they
+# make, which is enough to rebuild the undo and redo stacks on replay.
+class Journal:
+    def __init__(self, tilemap, filepath=None):
+        self.tilemap = tilemap
+        self.filepath = filepath  # None keeps the journal in memory only
+        self.done = []
+        self.undone = []
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def recover(tilemap, filepath):
+        journal = Journal(tilemap, filepath)
+        with open(filepath) as file:
+            text = file.read()
+
+        # a crash in the middle of a write leaves the last record incomplete
+        complete = text[: text.rfind("\n") + 1]
+        for lineno, line in enumerate(complete.splitlines(), start=1):
+            match = RECORD_PATTERN.match(line)
+            if match is None:
+                message = "line {:d}: {!r}".format(lineno, line)
+                raise InvalidTileDefinitionError(message)
+
+            op = match[2], (int(match[4]), int(match[5])), string2tile(match[3])
+            try:
+                journal.apply(op)
+            except InvalidTilePlacementError:
+                message = "line {:d}: invalid move at {}".format(lineno, op[1])
+                raise InvalidTilePlacementError(message)
+
+            journal.restack(match[1], op)
+
+        if len(complete) < len(text):
+            with open(filepath, "r+") as file:
+                file.truncate(len(complete))
+
+        return journal
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def apply(self, op):
+        action, pos, tile = op
+        if action == "+":
+            self.tilemap[pos] = tile
+        elif self.tilemap.tiles.get(pos) == tile:
+            del self.tilemap[pos]
+        else:
+            raise InvalidTilePlacementError
+
+    def restack(self, prefix, op):
+        if prefix == "u":
+            if self.done:
+                self.done.pop()
+            self.undone.append(inverse(op))
+        elif prefix == "r":
+            if self.undone:
+                self.undone.pop()
+            self.done.append(op)
+        else:
+            self.done.append(op)
+            self.undone.clear()
+
+    def record(self, prefix, op):
+        if self.filepath is None:
+            return
+
+        if self.file is None:
+            self.file = open(self.filepath, "a")
+
+        action, pos, tile = op
+        line = "{}{} {} {:d} {:d}\n".format(prefix, action, tile2string(tile), *pos)
+        self.file.write(line)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def commit(self, prefix, op):
+        self.apply(op)
+        self.restack(prefix, op)
+        self.record(prefix, op)
+
+    def place(self, pos, tile):
+        self.commit("", ("+", pos, tile))
+
+    def delete(self, pos):
+        self.commit("", ("-", pos, self.tilemap[pos]))
+
+    def undo(self):
+        if not self.done:
+            return False
+
+        self.commit("u", inverse(self.done[-1]))
+        return True
+
+    def redo(self):
+        if not self.undone:
+            return False
+
+        self.commit("r", self.undone[-1])
+        return True
+
+    def checkpoint(self, filepath=None):
+        # the map has been saved, so nothing before now needs replaying
+        self.discard()
+        if filepath is not None:
+            self.filepath = filepath
+
+    def discard(self):
+        self.close()
+        if self.filepath is not None and os.path.exists(self.filepath):
+            os.remove(self.filepath)
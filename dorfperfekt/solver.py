@@ -0,0 +1,606 @@
+import atexit
+import os
+import threading
+import time
+from bisect import insort
+from collections import Counter, OrderedDict, namedtuple
+from math import inf
+from multiprocessing import Array, Pool, TimeoutError, Value, cpu_count
+from multiprocessing.pool import ThreadPool
+from multiprocessing.shared_memory import SharedMemory
+
+from .stats import SolveStats
+from .tile import (  # local dorfperfekt imports
+    EDGE_BITS,
+    EDGE_MASK,
+    OPEN_RING,
+    canonical_code,
+    fits_perfectly,
+    rotational_period,
+    terrains2code,
+)
+from .tilemap import TileMap, adjacent_positions, hex_distance
+
+BACKENDS = ["process", "thread", "serial"]
+
+# ops that open or close a position no tile touches, see stranded_positions
+OPENED, CLOSED = "opened", "closed"
+
+# how often a solve waiting on its workers checks that it is still wanted
+POLL_SECONDS = 0.1
+
+# state of the worker process or thread, see Worker
+_local = threading.local()
+
+# tilemap state at which results for one (terrains, thresh) were computed
+Memo = namedtuple("Memo", "tiles kinds results fingerprint")
+
+
+def available_cpus():
+    # cpus this process may run on, within any container cpu quota
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = cpu_count()
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+
+    return cpus
+
+
+def weight(count, thresh):
+    return count if count >= thresh else 0
+
+
+def frontier_order(tilemap, positions, focus=None):
+    # nearest the focus first, or else the most enclosed positions first
+    if focus is not None:
+        return sorted(positions, key=lambda pos: (hex_distance(pos, focus), pos))
+
+    def enclosure(pos):
+        return sum([adj in tilemap.codes for adj in adjacent_positions(pos)])
+
+    return sorted(positions, key=lambda pos: (-enclosure(pos), pos))
+
+
+def chunked(positions, processes):
+    # chunks double in size so that the first results come back quickly, but
+    # stay under a share of what is left so that the workers finish together
+    chunks, start, size = [], 0, 1
+    while start < len(positions):
+        share = (len(positions) - start) // (2 * processes)
+        end = start + max(1, min(size, share))
+        chunks.append(positions[start:end])
+        start, size = end, 2 * size
+
+    return chunks
+
+
+def stranded_positions(tilemap):
+    # open positions that no tile touches, which only deletions leave behind;
+    # every other open position follows from the tiles
+    return {
+        pos
+        for pos in tilemap.open
+        if not any(adj in tilemap.codes for adj in adjacent_positions(pos))
+    }
+
+
+def relaxed_rings(tilemap, pos):
+    # outer ring of the position, and of each empty adjacent position with the
+    # edge towards the position left open, i.e. whatever gets placed there
+    yield canonical_code(tilemap.outer_code(pos))[0]
+
+    for ori, adj in enumerate(adjacent_positions(pos)):
+        if adj not in tilemap.codes:
+            mask = EDGE_MASK << EDGE_BITS * (5 - (ori + 3) % 6)
+            ring = tilemap.outer_code(adj) & ~mask | OPEN_RING & mask
+            yield canonical_code(ring)[0]
+
+
+def tighten(best, tilescores, top_k):
+    # keeps the top_k best full scores, and returns the k-th once there are k;
+    # the orientations repeated by a symmetric tile are the same placement
+    for score, tile in tilescores:
+        period = rotational_period(terrains2code(tile.terrains))
+        if len(score) == 3 and tile.ori < period:
+            insort(best, score)
+    del best[top_k:]
+
+    return best[-1] if len(best) == top_k else None
+
+
+def lower_bound(bound, generation, solving, score):
+    # only while the solve the score belongs to has not been cancelled
+    with bound.get_lock():
+        if generation.value == solving and tuple(score) < tuple(bound):
+            bound[:] = score
+
+
+class Replica:
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.applied = 0
+
+    def sync(self, ops):
+        for pos, tile in ops[self.applied :]:
+            if tile is None:
+                del self.tilemap[pos]
+            elif tile == OPENED:
+                self.tilemap.open.add(pos)
+            elif tile == CLOSED:
+                self.tilemap.open.discard(pos)
+            else:
+                self.tilemap[pos] = tile
+
+        self.applied = len(ops)
+
+
+class Worker:
+    def __init__(self, tilemap, generation, bound):
+        self.replica = Replica(tilemap)
+        self.generation = generation  # of the solve to work on, see cancel
+        self.bound = bound  # score of the k-th best placement, see scores
+        self.solve = None
+        self.best = []  # best full scores this worker found in that solve
+
+    def score_chunk(self, task):
+        ops, generation, positions, args, profile, bounded = task
+        if self.generation.value != generation:
+            # the ops of a cancelled solve may be behind those already replayed
+            return None, None
+
+        tilemap = self.replica.tilemap
+        tilemap.stats = SolveStats() if profile else None
+
+        with tilemap.timer("replaying ops"):
+            self.replica.sync(ops)
+
+        top_k = None
+        if bounded is not None:
+            solve, top_k = bounded
+            if self.solve != solve:
+                self.solve, self.best = solve, []
+
+        results = []
+        with tilemap.timer("scoring {:d} terms".format(args[-1])):
+            for pos in positions:
+                if self.generation.value != generation:
+                    return None, None
+
+                if top_k is None:
+                    results.append(tilemap.score_pos((pos, *args)))
+                    continue
+
+                with self.bound.get_lock():
+                    bound = tuple(self.bound)
+                results.append(tilemap.score_pos((pos, *args), bound))
+
+                kth = tighten(self.best, results[-1][1], top_k)
+                if kth is not None:
+                    lower_bound(self.bound, self.generation, generation, kth)
+
+        return results, tilemap.stats
+
+
+def _init_worker(snapshot, generation, bound):
+    # worker processes are given the name of a shared memory block to read the
+    # snapshot from, threads the snapshot itself
+    if isinstance(snapshot, str):
+        shm = SharedMemory(snapshot)
+        try:
+            tilemap = TileMap.from_snapshot(shm.buf)
+        finally:
+            shm.close()
+    else:
+        tilemap = TileMap.from_snapshot(snapshot)
+
+    _local.worker = Worker(tilemap, generation, bound)
+
+
+def _score_chunk(task):
+    return _local.worker.score_chunk(task)
+
+
+class LocalValue:
+    # stands in for multiprocessing.Value when no processes are involved
+    def __init__(self, value=0):
+        self.value = value
+        self.lock = threading.Lock()
+
+    def get_lock(self):
+        return self.lock
+
+
+class LocalArray(list):
+    # stands in for multiprocessing.Array when no processes are involved
+    def __init__(self, values):
+        super().__init__(values)
+        self.lock = threading.Lock()
+
+    def get_lock(self):
+        return self.lock
+
+
+class SerialPool:
+    # runs the tasks one by one in the thread consuming the results
+    def __init__(self, snapshot, generation, bound):
+        self.worker = Worker(TileMap.from_snapshot(snapshot), generation, bound)
+
+    def imap_unordered(self, func, tasks):
+        for task in tasks:
+            _local.worker = self.worker
+            yield func(task)
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+# A snapshot of the tilemap is shared with the workers once when the pool starts,
+# through shared memory for worker processes, see TileMap.write_snapshot. Every
+# later solve only ships the placements and deletions made since then, which the
+# workers replay onto their replicas before scoring. Workers are processes, or
+# threads for free-threaded builds, or the serial backend scores in the thread
+# that consumes the results.
+class SolverEngine:
+    def __init__(
+        self,
+        processes=None,
+        max_ops=256,
+        incremental=False,
+        max_memos=8,
+        backend="process",
+        profile=False,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError("unknown solver backend: {}".format(backend))
+
+        if backend == "serial":
+            processes = 1
+        elif processes is None:
+            processes = max(1, available_cpus() // 2)
+
+        self.backend = backend
+        self.processes = processes
+        self.profile = profile  # also time the workers, see SolveStats
+        self.max_ops = max_ops
+        self.incremental = incremental
+        self.max_memos = max_memos
+        self.memos = OrderedDict()  # Memo by (terrains, thresh), oldest first
+        if backend == "process":
+            self.generation = Value("l", 0)
+            self.bound = Array("d", [inf] * 3)
+        else:
+            self.generation = LocalValue()
+            self.bound = LocalArray([inf] * 3)
+        self.solves = 0
+        self.rescored = []
+        self.stats = SolveStats()  # of the latest solve
+        self.pool = None
+        self.shm = None
+        self.snapshot = None
+        self.fingerprint = None  # of the tilemap as the workers hold it
+        self.stranded = set()  # ...and its stranded open positions
+        self.ops = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # solves still running on the pool end, see receive
+        self.cancel()
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def cancel(self):
+        # workers skip what is left of the current solve, and it stops yielding
+        with self.generation.get_lock():
+            self.generation.value += 1
+
+    def rebase(self, tilemap):
+        self.close()
+        size = tilemap.snapshot_size()
+        if self.backend == "process":
+            # kept until the pool closes, in case a worker has to be replaced
+            self.shm = SharedMemory(create=True, size=size)
+            tilemap.write_snapshot(self.shm.buf)
+            args = self.shm.name, self.generation, self.bound
+            self.pool = Pool(self.processes, _init_worker, args)
+        else:
+            snapshot = bytearray(size)
+            tilemap.write_snapshot(snapshot)
+            if self.backend == "thread":
+                args = snapshot, self.generation, self.bound
+                self.pool = ThreadPool(self.processes, _init_worker, args)
+            else:
+                self.pool = SerialPool(snapshot, self.generation, self.bound)
+        self.snapshot = dict(tilemap.tiles)
+        self.fingerprint = tilemap.fingerprint
+        self.stranded = stranded_positions(tilemap)
+        self.ops = []
+
+    def deltas(self, tilemap, stranded):
+        before, after = self.snapshot, tilemap.tiles
+        ops = [(pos, None) for pos, tile in before.items() if after.get(pos) != tile]
+        deleted = {pos for pos, _ in ops}
+        present = {pos for pos, tile in before.items() if after.get(pos) == tile}
+        pending = [(pos, tile) for pos, tile in after.items() if pos not in present]
+
+        # replicas only accept placements adjacent to a tile they already hold,
+        # or at the positions they hold open with no tile next to them
+        while pending:
+            deferred = []
+            for pos, tile in pending:
+                adjacent = any(adj in present for adj in adjacent_positions(pos))
+                if adjacent or pos in self.stranded:
+                    ops.append((pos, tile))
+                    present.add(pos)
+                else:
+                    deferred.append((pos, tile))
+
+            if len(deferred) == len(pending):
+                return None
+
+            pending = deferred
+
+        # replicas strand only the positions deleted from them, or left as they
+        # were, and are told which of these to keep open
+        for pos in sorted(self.stranded | stranded | deleted):
+            if not any(adj in after for adj in (pos, *adjacent_positions(pos))):
+                ops.append((pos, OPENED if pos in tilemap.open else CLOSED))
+
+        return ops
+
+    def sync(self, tilemap):
+        # any map syncs by its deltas, the solver is often handed a fresh copy
+        if self.pool is not None:
+            stranded = stranded_positions(tilemap)
+            if tilemap.fingerprint == self.fingerprint and stranded == self.stranded:
+                return
+
+            ops = self.deltas(tilemap, stranded)
+            if ops is not None and len(self.ops) + len(ops) <= self.max_ops:
+                # solves still running on the replicas as they were end
+                self.cancel()
+                self.ops.extend(ops)
+                self.snapshot = dict(tilemap.tiles)
+                self.fingerprint = tilemap.fingerprint
+                self.stranded = stranded
+                return
+
+        self.rebase(tilemap)
+
+    def dirty(self, tilemap, memo, kind, thresh):
+        tiles, kinds, results, _ = memo
+
+        # a score depends on the tiles within two steps of its position
+        near = {
+            pos
+            for pos in tiles.keys() | tilemap.tiles.keys()
+            if tiles.get(pos) != tilemap.tiles.get(pos)
+        }
+        for _ in range(2):
+            near.update([adj for pos in near for adj in adjacent_positions(pos)])
+
+        # ...and on the counts of the tiles that fit perfectly around it
+        recounted = [
+            k
+            for k in kinds.keys() | tilemap.kinds.keys()
+            if weight(kinds[k], thresh) != weight(tilemap.kinds[k], thresh)
+            or k == kind
+            and weight(kinds[k] + 1, thresh) != weight(tilemap.kinds[k] + 1, thresh)
+        ]
+
+        return {
+            pos
+            for pos in tilemap.open
+            if pos in near
+            or pos not in results
+            or recounted
+            and any(
+                fits_perfectly(ring, k)
+                for ring in relaxed_rings(tilemap, pos)
+                for k in recounted
+            )
+        }
+
+    def scores(self, tilemap, terrains, thresh=1, focus=None, top_k=None):
+        # With top_k, placements that cannot be among the top_k best are only
+        # scored as far as needed to tell, so they sort after those that can.
+        # The bound is the k-th best full score found so far by any worker.
+        staged = self.staged_scores(
+            tilemap, terrains, thresh, focus, stages=(3,), top_k=top_k
+        )
+        for _, pos, tilescores in staged:
+            yield pos, tilescores
+
+    def staged_scores(
+        self,
+        tilemap,
+        terrains,
+        thresh=1,
+        focus=None,
+        stages=(1, 2, 3),
+        top_k=None,
+        waiting=None,
+    ):
+        # Yields (terms, pos, tilescores) with scores cut down to their first
+        # terms, see TileMap.score_tile. Each stage covers every position, so
+        # cheap partial scores for the whole map arrive before any costly one.
+        # Within a stage positions are sent out in frontier_order. If given,
+        # waiting is called whenever the solve is about to wait on the workers.
+        if top_k is not None and top_k < 1:
+            raise ValueError("top_k must be at least 1")
+
+        generation = self.generation.value
+        self.stats = stats = SolveStats()
+        start = time.perf_counter()
+
+        self.solves += 1
+        best = []
+        with self.bound.get_lock():
+            self.bound[:] = [inf] * 3
+
+        with stats.timer("planning"):
+            key = terrains, thresh
+            memo = self.memos.pop(key, None) if self.incremental else None
+
+            if memo is None:
+                positions = list(tilemap.open)
+                results = {}
+            else:
+                if memo.fingerprint == tilemap.fingerprint:
+                    # nothing placed or deleted since, only unscored positions
+                    dirty = {pos for pos in tilemap.open if pos not in memo.results}
+                else:
+                    kind = terrains2code(terrains)
+                    dirty = self.dirty(tilemap, memo, kind, thresh)
+                positions = list(dirty)
+                results = {
+                    pos: memo.results[pos] for pos in tilemap.open if pos not in dirty
+                }
+
+        stats.counts["positions"] = len(tilemap.open)
+        stats.counts["rescored"] = len(positions)
+
+        if self.incremental:
+            # results are filled in below as they arrive, so that an abandoned
+            # solve still leaves a usable memo behind
+            tiles, kinds = dict(tilemap.tiles), Counter(tilemap.kinds)
+            self.memos[key] = Memo(tiles, kinds, results, tilemap.fingerprint)
+            while len(self.memos) > self.max_memos:
+                self.memos.popitem(last=False)
+
+            for pos, tilescores in list(results.items()):
+                if top_k is not None:
+                    kth = tighten(best, tilescores, top_k)
+                    if kth is not None:
+                        lower_bound(self.bound, self.generation, generation, kth)
+                yield 3, pos, tilescores
+
+        self.rescored = positions
+        if not positions:
+            stats.times["solve"] = time.perf_counter() - start
+            return
+
+        if waiting is not None:
+            waiting()
+
+        if self.generation.value != generation:
+            return
+
+        pool, applied = self.pool, len(self.ops)
+        with stats.timer("syncing workers"):
+            self.sync(tilemap)
+        stats.counts["rebases"] = int(self.pool is not pool)
+        if self.pool is not pool or len(self.ops) != applied:
+            # moving the replicas on cancelled the solves on them, this one too
+            generation += 1
+
+        ops = tuple(self.ops)
+        chunks = chunked(frontier_order(tilemap, positions, focus), self.processes)
+        stats.counts["chunks"] = len(chunks) * len(stages)
+
+        for terms in stages:
+            if self.generation.value != generation:
+                return
+
+            args = terrains, thresh, terms
+            bounded = None if top_k is None or terms < 3 else (self.solves, top_k)
+            tasks = [
+                (ops, generation, chunk, args, self.profile, bounded)
+                for chunk in chunks
+            ]
+            received = 0
+            kth = None
+            try:
+                received_chunks = self.receive(tasks, stats, generation, waiting)
+                for scored, worker_stats in received_chunks:
+                    if scored is None:  # skipped by the workers
+                        return
+
+                    if worker_stats is not None:
+                        stats.update(worker_stats)
+
+                    for pos, tilescores in scored:
+                        if self.generation.value != generation:
+                            return
+
+                        received += 1
+                        if bounded is not None:
+                            # pruned scores are not kept for later solves
+                            kth = tighten(best, tilescores, top_k)
+                        elif terms == 3:
+                            results[pos] = tilescores
+                        yield terms, pos, tilescores
+
+                    if bounded is not None and kth is not None:
+                        lower_bound(self.bound, self.generation, generation, kth)
+            finally:
+                # abandoned solves would otherwise keep the workers busy
+                if received < len(positions) and self.generation.value == generation:
+                    self.cancel()
+
+                stats.times["solve"] = time.perf_counter() - start
+
+    def receive(self, tasks, stats, generation, waiting=None):
+        # chunks of results as they arrive, timing how long they are awaited;
+        # ends early once the solve is cancelled or its pool is closed, as the
+        # results of a terminated pool never arrive
+        pool = self.pool
+        results = pool.imap_unordered(_score_chunk, tasks)
+        while True:
+            if waiting is not None:
+                waiting()
+
+            with stats.timer("waiting on workers"):
+                result = self.next_result(results, pool, generation)
+
+            if result is None:
+                return
+
+            yield result
+
+    def next_result(self, results, pool, generation):
+        if isinstance(pool, SerialPool):
+            return next(results, None)
+
+        while True:
+            try:
+                return results.next(timeout=POLL_SECONDS)
+            except StopIteration:
+                return None
+            except TimeoutError:
+                if self.pool is not pool or self.generation.value != generation:
+                    return None
+
+
+_default_engine = None
+
+
+def default_engine():
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = SolverEngine()
+        atexit.register(_default_engine.close)
+
+    return _default_engine
@@ -0,0 +1,48 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+# Counters and timers of one solve. Timers of the workers are summed over all
+# of them, so they may add up to more than the time the solve took.
+class SolveStats:
+    def __init__(self):
+        self.counts = Counter()
+        self.times = Counter()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += time.perf_counter() - start
+
+    def update(self, other):
+        self.counts.update(other.counts)
+        self.times.update(other.times)
+
+    def hit_rate(self, cache):
+        hits = self.counts[cache + " hits"]
+        lookups = hits + self.counts[cache + " misses"]
+        return hits / lookups if lookups else None
+
+    def summary(self):
+        fstring = "Scored {:d} positions ({:d} rescored) in {:.2f}s."
+        return fstring.format(
+            self.counts["positions"], self.counts["rescored"], self.times["solve"]
+        )
+
+    def report(self):
+        lines = [self.summary()]
+        for name, seconds in sorted(self.times.items()):
+            lines.append("  {:<28} {:9.3f}s".format(name, seconds))
+
+        for name, count in sorted(self.counts.items()):
+            lines.append("  {:<28} {:9d}".format(name, count))
+
+        rate = self.hit_rate("alternates memo")
+        if rate is not None:
+            lines.append("  {:<28} {:9.1%}".format("alternates memo hit rate", rate))
+
+        return "\n".join(lines)
@@ -1,6 +1,7 @@
 from collections import namedtuple
+from enum import Enum, unique
+from functools import total_ordering
 
-from aenum import OrderedEnum, unique
 from cachetools.func import lfu_cache
 
 
@@ -8,6 +9,15 @@ class InvalidTileDefinitionError(ValueError):
     pass
 
 
+@total_ordering
+class OrderedEnum(Enum):
+    def __lt__(self, other):
+        if self.__class__ is other.__class__:
+            return self.value < other.value
+
+        return NotImplemented
+
+
 @unique
 class Terrain(OrderedEnum):
     GRASS = "G"
@@ -114,3 +124,200 @@ def validate_tiles(tiles):
                 return False, None
 
         return True, tuple(is_perfect)
+
+
+# Compact encoding: a tile (or an outer ring) packed into an int, four bits per
+# edge with edge 0 in the most significant nibble. Terrain codes follow the
+# OrderedEnum ordering so comparing codes matches comparing terrain tuples.
+EDGE_BITS = 4
+EDGE_MASK = (1 << EDGE_BITS) - 1
+CODE_MASK = (1 << 6 * EDGE_BITS) - 1
+
+CODE_TERRAINS = tuple(sorted(Terrain))
+TERRAIN_CODES = {terrain: code for code, terrain in enumerate(CODE_TERRAINS)}
+OPEN_CODE = TERRAIN_CODES[Terrain.OPEN]
+OPEN_RING = sum(OPEN_CODE << EDGE_BITS * k for k in range(6))
+
+# memoized lookups are cleared wholesale once they grow past this many entries
+MAX_MEMO = 2**18
+
+
+def terrains2code(terrains):
+    code = 0
+    for terrain in terrains:
+        code = code << EDGE_BITS | TERRAIN_CODES[terrain]
+
+    return code
+
+
+def code2terrains(code):
+    return tuple(CODE_TERRAINS[edge_code(code, ori)] for ori in range(6))
+
+
+def edge_code(code, ori):
+    return code >> EDGE_BITS * (5 - ori) & EDGE_MASK
+
+
+def rotate_code(code, ori):
+    # positive orientations rotate clockwise, matching Tile.ori
+    shift = EDGE_BITS * (ori % 6)
+    return (code >> shift | code << 6 * EDGE_BITS - shift) & CODE_MASK
+
+
+_canonical = {}
+
+
+def canonical_code(code):
+    try:
+        return _canonical[code]
+    except KeyError:
+        pass
+
+    final_code, final_ori = code, 0
+    for rot_ori in range(1, 6):
+        rot_code = rotate_code(code, -rot_ori)
+        if rot_code < final_code:
+            final_code, final_ori = rot_code, rot_ori
+
+    _canonical[code] = final_code, final_ori
+    return final_code, final_ori
+
+
+_periods = {}
+
+
+def rotational_period(code):
+    # rotations after which a tile looks the same again, 1, 2, 3 or 6, so only
+    # the first that many orientations are distinct placements
+    canonical, _ = canonical_code(code)
+    try:
+        return _periods[canonical]
+    except KeyError:
+        pass
+
+    period = next(p for p in (1, 2, 3, 6) if rotate_code(canonical, p) == canonical)
+    _periods[canonical] = period
+    return period
+
+
+def tile2code(tile):
+    return rotate_code(terrains2code(tile.terrains), tile.ori)
+
+
+_tiles = {}
+
+
+def code2tile(code):
+    try:
+        return _tiles[code]
+    except KeyError:
+        pass
+
+    canonical, ori = canonical_code(code)
+    _tiles[code] = tile = Tile(code2terrains(canonical), ori)
+    return tile
+
+
+def is_tile_code(code):
+    # a placeable tile, as opposed to an outer ring or garbage
+    if not 0 <= code <= CODE_MASK:
+        return False
+
+    edges = [edge_code(code, ori) for ori in range(6)]
+    return all(edge < len(CODE_TERRAINS) and edge != OPEN_CODE for edge in edges)
+
+
+def string2code(string):
+    return tile2code(string2tile(string))
+
+
+def code2string(code):
+    return "".join(terrain.value for terrain in code2terrains(code))
+
+
+_EDGE_VALIDITY = {
+    (TERRAIN_CODES[inner], TERRAIN_CODES[outer]): validate_terrains(inner, outer)
+    for inner in Terrain
+    for outer in Terrain
+}
+
+
+def validate_codes(inner, outer):
+    # returns validity and a bitmask of the imperfect edges (bit k for edge k)
+    imperfect = 0
+    for ori in range(6):
+        shift = EDGE_BITS * (5 - ori)
+        edges = inner >> shift & EDGE_MASK, outer >> shift & EDGE_MASK
+        is_valid, is_perfect = _EDGE_VALIDITY[edges]
+        if not is_valid:
+            return False, None
+        elif is_perfect is False:
+            imperfect |= 1 << ori
+
+    return True, imperfect
+
+
+# outer edge terrain codes that an inner edge terrain code fits perfectly
+_PERFECT_OUTER = {
+    inner: frozenset(
+        outer
+        for outer in range(len(CODE_TERRAINS))
+        if _EDGE_VALIDITY[inner, outer] == (True, True)
+    )
+    for inner in range(len(CODE_TERRAINS))
+}
+
+
+def perfect_terrains(code):
+    # outer edge terrain codes that some edge of the tile fits perfectly, a
+    # tile only fits a ring perfectly if it has such an edge for every terrain
+    return frozenset().union(*[_PERFECT_OUTER[edge_code(code, k)] for k in range(6)])
+
+
+def ring_terrains(outer):
+    # terrain codes on the edges of an outer ring, open edges left out
+    return {edge_code(outer, ori) for ori in range(6)} - {OPEN_CODE}
+
+
+_placements = {}
+
+
+def placements(outer, code):
+    # valid orientations of a tile code against an outer ring code, along with
+    # the imperfect edge mask of each, both relative to the given codes; of the
+    # orientations that give the same placement only the first is listed
+    key = outer, code
+    try:
+        return _placements[key]
+    except KeyError:
+        pass
+
+    fits = []
+    for ori in range(rotational_period(code)):
+        valid, imperfect = validate_codes(rotate_code(code, ori), outer)
+        if valid:
+            fits.append((ori, imperfect))
+
+    if len(_placements) >= MAX_MEMO:
+        _placements.clear()
+
+    _placements[key] = fits = tuple(fits)
+    return fits
+
+
+_perfect_fits = {}
+
+
+def fits_perfectly(outer, code):
+    key = outer, code
+    try:
+        return _perfect_fits[key]
+    except KeyError:
+        pass
+
+    if len(_perfect_fits) >= MAX_MEMO:
+        _perfect_fits.clear()
+
+    fits = any(not imperfect for _, imperfect in placements(outer, code))
+    _perfect_fits[key] = fits
+    return fits
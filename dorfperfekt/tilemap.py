@@ -1,18 +1,30 @@
+import mmap
 import re
-from collections import Counter, OrderedDict
+import struct
+from collections import Counter, OrderedDict, defaultdict, deque
 from collections.abc import MutableMapping
+from contextlib import nullcontext
 from math import inf
-from multiprocessing import Pool, cpu_count
-
-from cachetools.func import lru_cache
 
 from .tile import (  # local dorfperfekt imports
-    Terrain,
+    EDGE_BITS,
+    EDGE_MASK,
+    MAX_MEMO,
+    OPEN_RING,
+    InvalidTileDefinitionError,
     Tile,
+    canonical_code,
+    code2tile,
+    fits_perfectly,
+    is_tile_code,
+    perfect_terrains,
+    ring_terrains,
+    rotate_code,
+    rotational_period,
     string2tile,
-    terrains2tile,
+    terrains2code,
     tile2string,
-    validate_tiles,
+    validate_codes,
 )
 
 
@@ -20,79 +32,347 @@ class InvalidTilePlacementError(ValueError):
     pass
 
 
+LINE_PATTERN = re.compile(r"^([GFRDWSTC]{6}) (-?\d+) (-?\d+)$")
+
+# Binary map files hold a header (magic, version, reserved, tile count and, from
+# version 2, the map's fingerprint) followed by one fixed size record per tile in
+# placement order. The records can be read in place, e.g.
+# numpy.memmap(filepath, BINARY_FIELDS, offset=BINARY_HEADER.size)
+BINARY_MAGIC = b"DORF"
+BINARY_VERSION = 2
+BINARY_HEADERS = {1: struct.Struct("<4sHHI"), 2: struct.Struct("<4sHHIQ")}
+BINARY_HEADER = BINARY_HEADERS[BINARY_VERSION]
+BINARY_RECORD = struct.Struct("<hhI")
+BINARY_FIELDS = [("x", "<i2"), ("y", "<i2"), ("code", "<u4")]
+
+# Snapshots are the complete state of a valid tilemap, for the solver to share
+# with its workers: a header (tile count, kind count, open count, fingerprint), one
+# record per tile with its ruined edge count, the kinds counter table, then the
+# open positions. These are stored as deletions can leave open positions no tile
+# touches, which a copy could not tell from the tiles alone.
+SNAPSHOT_HEADER = struct.Struct("<IIIQ")
+SNAPSHOT_TILE = struct.Struct("<hhIB")
+SNAPSHOT_KIND = struct.Struct("<II")
+SNAPSHOT_OPEN = struct.Struct("<hh")
+
 OFFSETS = [(1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)]
 
 # FUTURE IDEAS:
-#   1. self.ruined = set()
 #   3. self.solve(terrains, thresh1=1, thresh2=1)
 
 
-@lru_cache(maxsize=64)
+def discount(counter, key):
+    count = counter[key]
+    if count == 1:
+        del counter[key]
+    else:
+        counter[key] = count - 1
+
+
+MASK64 = (1 << 64) - 1
+
+
+def splitmix64(value):
+    # deterministic, unlike hash(), so fingerprints agree between processes
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = (value ^ value >> 30) * 0xBF58476D1CE4E5B9 & MASK64
+    value = (value ^ value >> 27) * 0x94D049BB133111EB & MASK64
+    return value ^ value >> 31
+
+
+# The fingerprint is the XOR of a term per tile, and the counter fingerprint the
+# sum of a term per kind times its count, so that both are updated in constant
+# time as tiles are placed and deleted.
+def tile_term(pos, code):
+    # coordinates wrap around at 20 bits, far beyond any map
+    return splitmix64((pos[0] & 0xFFFFF) << 44 | (pos[1] & 0xFFFFF) << 24 | code)
+
+
+def kind_term(kind):
+    return splitmix64(kind)
+
+
 def adjacent_positions(pos):
-    return [(pos[0] + off[0], pos[1] + off[1]) for off in OFFSETS]
+    # in the order of OFFSETS, unrolled as this is called for every lookup
+    x, y = pos
+    return (
+        (x + 1, y),
+        (x, y + 1),
+        (x - 1, y + 1),
+        (x - 1, y),
+        (x, y - 1),
+        (x + 1, y - 1),
+    )
+
+
+def hex_distance(pos1, pos2):
+    dx, dy = pos1[0] - pos2[0], pos1[1] - pos2[1]
+    return max(abs(dx), abs(dy), abs(dx + dy))
 
 
 class TileMap(MutableMapping):
-    def __init__(self):
+    def __init__(self, grid=False):
         self.tiles = OrderedDict()
+        self.codes = dict()  # position -> packed tile code, see tile.py
+        self.grid = None  # optional dense copy of codes, see grid.py
+        if grid:
+            from .grid import CodeGrid
+
+            self.grid = CodeGrid()
+
         self.counter = Counter()
-        self.ruined = list()
+        self.kinds = Counter()  # packed counterpart of counter
+        self.fingerprint = 0  # 64-bit hash of codes by position, see tile_term
+        self.counter_fingerprint = 0  # ...and of kinds, see kind_term
+        self.memo = dict()  # alternates by (ring, thresh, counter fingerprint)
+        self.fitting = defaultdict(set)  # terrain -> kinds fitting it perfectly
+        self.ruined = Counter()  # position -> number of imperfect edges
+        self.stats = None  # SolveStats while a solver profiles this map
         self.open = set([(0, 0)])
         self[0, 0] = string2tile("g")
 
     @staticmethod
-    def from_file(filepath):
-        tilemap = TileMap()
-        del tilemap[0, 0]
-        pattern = r"^([GFRDWSTC]{6}) (-?\d+) (-?\d+)$"
-        tiles = []
-        with open(filepath) as file:
-            for line in file:
-                match = re.match(pattern, line)
-                tile = string2tile(match[1])
+    def is_binary_file(filepath):
+        with open(filepath, "rb") as file:
+            return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+    @staticmethod
+    def from_file(filepath, grid=False):
+        if TileMap.is_binary_file(filepath):
+            return TileMap.from_binary_file(filepath, grid)
+
+        tiles, lines = [], []
+        with open(filepath, "rb") as file:
+            for lineno, line in enumerate(file, start=1):
+                try:
+                    line = line.decode().rstrip("\r\n")
+                except UnicodeDecodeError:
+                    message = "line {:d}: not valid UTF-8".format(lineno)
+                    raise InvalidTileDefinitionError(message) from None
+
+                if not line.strip():
+                    continue
+
+                match = LINE_PATTERN.match(line)
+                if match is None:
+                    message = "line {:d}: {!r}".format(lineno, line.rstrip())
+                    raise InvalidTileDefinitionError(message)
+
                 pos = (int(match[2]), int(match[3]))
-                tiles.append((pos, tile))
+                tiles.append((pos, string2tile(match[1])))
+                lines.append(lineno)
+
+        return TileMap.from_tiles(tiles, lines, grid)
+
+    @staticmethod
+    def from_binary_file(filepath, grid=False):
+        with open(filepath, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                if len(buffer) < BINARY_HEADER.size:
+                    raise InvalidTileDefinitionError("truncated binary map")
+
+                magic, version = struct.unpack_from("<4sH", buffer)
+                header = BINARY_HEADERS.get(version)
+                if magic != BINARY_MAGIC or header is None:
+                    message = "unsupported binary map (version {:d})".format(version)
+                    raise InvalidTileDefinitionError(message)
+
+                if len(buffer) < header.size:
+                    raise InvalidTileDefinitionError("truncated binary map")
+
+                _, _, _, count, *fingerprint = header.unpack_from(buffer)
+                if len(buffer) != header.size + count * BINARY_RECORD.size:
+                    raise InvalidTileDefinitionError("truncated binary map")
+
+                with memoryview(buffer) as view:
+                    body = view[header.size :]
+                    records = list(BINARY_RECORD.iter_unpack(body))
+                    body.release()
+
+        tiles = []
+        for idx, (x, y, code) in enumerate(records, start=1):
+            if not is_tile_code(code):
+                message = "tile {:d}: invalid tile code {:#08x}".format(idx, code)
+                raise InvalidTileDefinitionError(message)
 
-        while tiles:
-            removables = []
-            for pos, tile in tiles:
+            tiles.append(((x, y), code2tile(code)))
+
+        tilemap = TileMap.from_tiles(tiles, grid=grid)
+        if fingerprint and fingerprint[0] != tilemap.fingerprint:
+            raise InvalidTileDefinitionError("binary map fingerprint mismatch")
+
+        return tilemap
+
+    @staticmethod
+    def from_tiles(tiles, lines=None, grid=False):
+        # Places the tiles in the order that repeatedly sweeping the list for
+        # placeable tiles would, without the sweeps: the sweep in which a tile
+        # can be placed is its 0-1 BFS distance from the origin, where moving
+        # on to a tile further down the list is free and moving back costs one.
+        tiles = list(tiles)
+        lines = range(1, len(tiles) + 1) if lines is None else lines
+        index = dict()
+        for idx, (pos, _) in enumerate(tiles):
+            if pos in index:
+                message = "line {:d}: duplicate position {}".format(lines[idx], pos)
+                raise InvalidTilePlacementError(message)
+            index[pos] = idx
+
+        if (0, 0) not in index:
+            raise InvalidTilePlacementError("no tile at the origin")
+
+        sweeps = {(0, 0): 0}
+        queue = deque([(0, 0)])
+        while queue:
+            pos = queue.popleft()
+            for adj in adjacent_positions(pos):
+                if adj not in index:
+                    continue
+
+                cost = 0 if index[pos] < index[adj] else 1
+                if sweeps[pos] + cost < sweeps.get(adj, inf):
+                    sweeps[adj] = sweeps[pos] + cost
+                    if cost:
+                        queue.append(adj)
+                    else:
+                        queue.appendleft(adj)
+
+        buckets = defaultdict(list)
+        for idx, (pos, tile) in enumerate(tiles):
+            if pos not in sweeps:
+                message = "line {:d}: {} is not connected to the origin"
+                raise InvalidTilePlacementError(message.format(lines[idx], pos))
+            buckets[sweeps[pos]].append(idx)
+
+        tilemap = TileMap(grid)
+        del tilemap[0, 0]
+        for sweep in sorted(buckets):
+            for idx in buckets[sweep]:
+                pos, tile = tiles[idx]
                 try:
                     tilemap[pos] = tile
-                    removables.append((pos, tile))
                 except InvalidTilePlacementError:
-                    pass
+                    message = "line {:d}: invalid placement at {}"
+                    raise InvalidTilePlacementError(message.format(lines[idx], pos))
 
-            if removables:
-                for pos, tile in removables:
-                    tiles.remove((pos, tile))
-            else:
-                raise InvalidTilePlacementError
+        return tilemap
+
+    @staticmethod
+    def from_snapshot(buffer, grid=False):
+        # trusts the snapshot, nothing is validated or placed one by one
+        tilemap = TileMap(grid)
+        del tilemap[0, 0]
+
+        ntiles, nkinds, nopen, fingerprint = SNAPSHOT_HEADER.unpack_from(buffer)
+        start = SNAPSHOT_HEADER.size
+        end = start + ntiles * SNAPSHOT_TILE.size
+        with memoryview(buffer) as view:
+            with view[start:end] as records:
+                for x, y, code, ruined in SNAPSHOT_TILE.iter_unpack(records):
+                    tilemap.tiles[x, y] = code2tile(code)
+                    tilemap.codes[x, y] = code
+                    if tilemap.grid is not None:
+                        tilemap.grid[x, y] = code
+                    if ruined:
+                        tilemap.ruined[x, y] = ruined
+
+            start, end = end, end + nkinds * SNAPSHOT_KIND.size
+            with view[start:end] as records:
+                tilemap.kinds.update(dict(SNAPSHOT_KIND.iter_unpack(records)))
+
+            start, end = end, end + nopen * SNAPSHOT_OPEN.size
+            with view[start:end] as records:
+                tilemap.open = set(SNAPSHOT_OPEN.iter_unpack(records))
+                if tilemap.grid is not None:
+                    # open positions no tile touches are outside the margins
+                    for pos in tilemap.open:
+                        tilemap.grid.reserve(pos)
+
+        tilemap.fingerprint = fingerprint
+        for kind, count in tilemap.kinds.items():
+            tilemap.counter[code2tile(kind).terrains] = count
+            tilemap.counter_fingerprint += kind_term(kind) * count
+            tilemap.index_kind(kind)
+        tilemap.counter_fingerprint &= MASK64
 
         return tilemap
 
-    def write_file(self, filepath):
+    def snapshot_size(self):
+        return (
+            SNAPSHOT_HEADER.size
+            + len(self.codes) * SNAPSHOT_TILE.size
+            + len(self.kinds) * SNAPSHOT_KIND.size
+            + len(self.open) * SNAPSHOT_OPEN.size
+        )
+
+    def write_snapshot(self, buffer):
+        header = len(self.codes), len(self.kinds), len(self.open), self.fingerprint
+        SNAPSHOT_HEADER.pack_into(buffer, 0, *header)
+        offset = SNAPSHOT_HEADER.size
+        for pos, code in self.codes.items():
+            SNAPSHOT_TILE.pack_into(buffer, offset, *pos, code, self.ruined[pos])
+            offset += SNAPSHOT_TILE.size
+
+        for kind, count in self.kinds.items():
+            SNAPSHOT_KIND.pack_into(buffer, offset, kind, count)
+            offset += SNAPSHOT_KIND.size
+
+        for pos in self.open:
+            SNAPSHOT_OPEN.pack_into(buffer, offset, *pos)
+            offset += SNAPSHOT_OPEN.size
+
+    def copy(self):
+        buffer = bytearray(self.snapshot_size())
+        self.write_snapshot(buffer)
+        return TileMap.from_snapshot(buffer, self.grid is not None)
+
+    def write_file(self, filepath, binary=False):
+        if binary:
+            return self.write_binary_file(filepath)
+
         with open(filepath, "w") as file:
             fstring = "{} {:d} {:d}\n"
             for pos, tile in self.tiles.items():
                 line = fstring.format(tile2string(tile), *pos)
                 file.write(line)
 
+    def write_binary_file(self, filepath):
+        with open(filepath, "wb") as file:
+            header = (
+                BINARY_MAGIC,
+                BINARY_VERSION,
+                0,
+                len(self.tiles),
+                self.fingerprint,
+            )
+            file.write(BINARY_HEADER.pack(*header))
+            records = (BINARY_RECORD.pack(*pos, self.codes[pos]) for pos in self.tiles)
+            file.write(b"".join(records))
+
     def __setitem__(self, pos, tile):
-        outer = self.outer_tile(pos)
-        valid, perfect = validate_tiles(tile, outer)
+        kind = terrains2code(tile.terrains)
+        code = rotate_code(kind, tile.ori)
+        valid, imperfect = validate_codes(code, self.outer_code(pos))
 
         if not (valid and pos in self.open):
             raise InvalidTilePlacementError
 
         self.tiles[pos] = tile
+        self.codes[pos] = code
+        if self.grid is not None:
+            self.grid[pos] = code
         self.open.remove(pos)
+        self.fingerprint ^= tile_term(pos, code)
         self.counter[tile.terrains] += 1
+        self.kinds[kind] += 1
+        self.counter_fingerprint = self.counter_fingerprint + kind_term(kind) & MASK64
+        if self.kinds[kind] == 1:
+            self.index_kind(kind)
 
-        adj = adjacent_positions(pos)
-
-        for adj_pos, adj_perfect in zip(adj, perfect):
-            if adj_perfect is False:
-                self.ruined.extend([pos, adj_pos])
+        for ori, adj_pos in enumerate(adjacent_positions(pos)):
+            if imperfect >> ori & 1:
+                self.ruined[pos] += 1
+                self.ruined[adj_pos] += 1
 
             if adj_pos not in self:
                 self.open.add(adj_pos)
@@ -102,24 +382,27 @@ class TileMap(MutableMapping):
 
     def __delitem__(self, pos):
         inner = self[pos]
-        outer = self.outer_tile(pos)
-        _, perfect = validate_tiles(inner, outer)
+        code = self.codes[pos]
+        _, imperfect = validate_codes(code, self.outer_code(pos))
 
         del self.tiles[pos]
+        del self.codes[pos]
+        if self.grid is not None:
+            del self.grid[pos]
         self.open.add(pos)
+        self.fingerprint ^= tile_term(pos, code)
 
-        count = self.counter[inner.terrains]
-        if count == 1:
-            del self.counter[inner.terrains]
-        else:
-            self.counter[inner.terrains] = count - 1
+        kind = rotate_code(code, -inner.ori)
+        discount(self.counter, inner.terrains)
+        discount(self.kinds, kind)
+        self.counter_fingerprint = self.counter_fingerprint - kind_term(kind) & MASK64
+        if kind not in self.kinds:
+            self.index_kind(kind, remove=True)
 
-        adj = adjacent_positions(pos)
-
-        for adj_pos, adj_perfect in zip(adj, perfect):
-            if adj_perfect is False:
-                self.ruined.remove(pos)
-                self.ruined.remove(adj_pos)
+        for ori, adj_pos in enumerate(adjacent_positions(pos)):
+            if imperfect >> ori & 1:
+                discount(self.ruined, pos)
+                discount(self.ruined, adj_pos)
 
             if adj_pos not in self:
                 adj_adj = adjacent_positions(adj_pos)
@@ -127,79 +410,153 @@ class TileMap(MutableMapping):
                 if not found:
                     self.open.discard(adj_pos)
 
+    def index_kind(self, kind, remove=False):
+        for terrain in perfect_terrains(kind):
+            if remove:
+                self.fitting[terrain].discard(kind)
+            else:
+                self.fitting[terrain].add(kind)
+
+    def candidate_kinds(self, outer):
+        # the kinds that may fit the ring perfectly, see perfect_terrains
+        terrains = ring_terrains(outer)
+        if not terrains:
+            return self.kinds.keys()
+
+        fitting = sorted([self.fitting[terrain] for terrain in terrains], key=len)
+        return fitting[0].intersection(*fitting[1:])
+
     def __iter__(self):
         return self.tiles.__iter__()
 
     def __len__(self):
         return len(self.tiles)
 
-    def outer_tile(self, pos):
-        terrains = [Terrain.OPEN] * 6
+    def outer_code(self, pos):
+        ring = OPEN_RING
         for ori, adj in enumerate(adjacent_positions(pos)):
-            if adj in self:
-                tile = self[adj]
-                terrains[ori] = tile.terrains[(ori - tile.ori + 3) % 6]
+            code = self.codes.get(adj)
+            if code is not None:
+                # the adjacent tile's opposite edge, moved into this edge's slot
+                mask = EDGE_MASK << EDGE_BITS * (5 - ori)
+                ring = ring & ~mask | rotate_code(code, 3) & mask
 
-        return terrains2tile(tuple(terrains))
+        return ring
+
+    def outer_tile(self, pos):
+        return code2tile(self.outer_code(pos))
 
     def perfect_alternates(self, pos, thresh=1):
-        count = 0
-        pre_ruined = len(set(self.ruined))
-        for terrains, subcount in self.counter.items():
-            if subcount < thresh:
-                continue
+        if pos not in self.open:
+            return 0
+
+        outer, _ = canonical_code(self.outer_code(pos))
+        key = outer, thresh, self.counter_fingerprint
+        try:
+            count = self.memo[key]
+        except KeyError:
+            pass
+        else:
+            if self.stats is not None:
+                self.stats.counts["alternates memo hits"] += 1
+            return count
 
-            for ori in range(6):
-                try:
-                    self[pos] = Tile(terrains, ori)
-                    post_ruined = len(set(self.ruined))
-                    del self[pos]
-                    newly_ruined = post_ruined - pre_ruined
-                    if not newly_ruined:
-                        count += subcount
-                        break
-                except InvalidTilePlacementError:
-                    pass
+        if self.stats is not None:
+            self.stats.counts["alternates memo misses"] += 1
 
+        if len(self.memo) >= MAX_MEMO:
+            self.memo.clear()
+
+        self.memo[key] = count = sum(
+            self.kinds[kind]
+            for kind in self.candidate_kinds(outer)
+            if self.kinds[kind] >= thresh and fits_perfectly(outer, kind)
+        )
         return count
 
-    def score_tile(self, pos, tile, thresh=1):
-        pre_ruined = len(set(self.ruined))
+    def score_tile(self, pos, tile, thresh=1, terms=3, bound=None):
+        code = rotate_code(terrains2code(tile.terrains), tile.ori)
+        valid, imperfect = validate_codes(code, self.outer_code(pos))
 
-        self[pos] = tile
+        if not (valid and pos in self.open):
+            raise InvalidTilePlacementError
 
-        open_adj = [adj for adj in adjacent_positions(pos) if adj in self.open]
-        secondorder_alternates = (
-            min([self.perfect_alternates(adj, thresh) for adj in open_adj])
-            if open_adj
-            else inf
+        # the tile itself and every tile across an imperfect edge become ruined
+        newly_ruined = int(imperfect != 0) + sum(
+            [
+                adj not in self.ruined
+                for ori, adj in enumerate(adjacent_positions(pos))
+                if imperfect >> ori & 1
+            ]
         )
+        if terms == 1:
+            return (newly_ruined,)
+
+        # a placement whose first terms already score worse than the bound, a
+        # full score, is left with those terms, see SolverEngine.scores
+        if bound is not None and (newly_ruined,) > bound[:1]:
+            return self.pruned((newly_ruined,))
 
-        post_ruined = len(set(self.ruined))
+        with self.timer("alternates"):
+            alternates = self.perfect_alternates(pos, thresh)
+        if terms == 2:
+            return newly_ruined, alternates
 
-        del self[pos]
+        if bound is not None and (newly_ruined, alternates) > bound[:2]:
+            return self.pruned((newly_ruined, alternates))
 
-        newly_ruined = post_ruined - pre_ruined
+        with self.timer("secondorder"):
+            # deleting the tile again would close open positions no tile touches
+            was_open = [adj for adj in adjacent_positions(pos) if adj in self.open]
+            self[pos] = tile
 
-        alternates = self.perfect_alternates(pos, thresh)
+            open_adj = [adj for adj in adjacent_positions(pos) if adj in self.open]
+            secondorder_alternates = (
+                min([self.perfect_alternates(adj, thresh) for adj in open_adj])
+                if open_adj
+                else inf
+            )
+
+            del self[pos]
+            self.open.update(was_open)
 
         return newly_ruined, alternates, -secondorder_alternates
 
-    def score_pos(self, args):
-        pos, terrains, thresh = args
+    def pruned(self, score):
+        if self.stats is not None:
+            self.stats.counts["pruned at {:d} terms".format(len(score))] += 1
+        return score
+
+    def timer(self, name):
+        return nullcontext() if self.stats is None else self.stats.timer(name)
+
+    def score_pos(self, args, bound=None):
+        # args may end with the number of score terms wanted, see score_tile
+        pos, terrains, thresh, *terms = args
+        period = rotational_period(terrains2code(terrains))
         scores = set()
-        for ori in range(6):
+        for ori in range(period):
             try:
                 tile = Tile(terrains, ori)
-                score = self.score_tile(pos, tile, thresh)
-                scores.add((score, tile))
+                score = self.score_tile(pos, tile, thresh, *terms, bound=bound)
             except InvalidTilePlacementError:
-                pass
+                continue
+
+            # symmetric orientations are the same placement, with the same score
+            for same in range(ori, 6, period):
+                scores.add((score, Tile(terrains, same)))
 
         return pos, scores
 
-    def scores(self, terrains, thresh=1):
-        args = ((pos, terrains, thresh) for pos in self.open)
-        with Pool(cpu_count() // 2) as pool:
-            for score in pool.imap_unordered(self.score_pos, args):
-                yield score
+    def batch_scores(self, terrains, thresh=1):
+        from .batch import batch_scores
+
+        return batch_scores(self, terrains, thresh)
+
+    def scores(self, terrains, thresh=1, engine=None, focus=None, top_k=None):
+        if engine is None:
+            from .solver import default_engine
+
+            engine = default_engine()
+
+        return engine.scores(self, terrains, thresh, focus, top_k)
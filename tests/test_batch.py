@@ -0,0 +1,28 @@
+import pytest
+
+from dorfperfekt.tile import string2tile
+from dorfperfekt.tilemap import TileMap
+
+
+@pytest.mark.parametrize(
+    "filein", ["demo_game.txt", "invalid_position.txt", "perfect_station.txt"]
+)
+@pytest.mark.parametrize("string", ["g", "s", "t", "wggwgg", "rrffww"])
+@pytest.mark.parametrize("thresh", [1, 2])
+def test_batch_scores(filein, string, thresh):
+    tilemap = TileMap.from_file("tests/scenarios/" + filein)
+    terrains = string2tile(string).terrains
+
+    serial = dict(
+        tilemap.score_pos((pos, terrains, thresh)) for pos in list(tilemap.open)
+    )
+    assert dict(tilemap.batch_scores(terrains, thresh)) == serial
+
+
+def test_batch_new_map():
+    tilemap = TileMap()
+    scores = dict(tilemap.batch_scores(string2tile("r").terrains, thresh=5))
+    assert {score for score, _ in scores[1, 0]} == {(2, 0, 0)}
+
+    scores = dict(tilemap.batch_scores(string2tile("t").terrains))
+    assert scores == {pos: set() for pos in tilemap.open}
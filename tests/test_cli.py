@@ -0,0 +1,123 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from dorfperfekt.cli import main
+from dorfperfekt.tilemap import hex_distance
+
+
+def test_ranked(capsys):
+    assert main(["tests/scenarios/perfect_station.txt", "s", "--top", "6"]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert len(lines) == 6
+    assert len({tuple(line["pos"]) for line in lines}) == 6
+    assert lines[0] == {
+        "pos": [2, -1],
+        "rotation": 0,
+        "tile": "SSSSSS",
+        "score": [0, 0, None],
+    }
+
+
+def test_ranked_symmetric(capsys):
+    # a symmetric tile is ranked once per placement, not once per orientation
+    assert main(["tests/scenarios/demo_game.txt", "gfgfgf", "--top", "4"]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    placements = {(tuple(line["pos"]), line["rotation"]) for line in lines}
+    assert len(placements) == 4
+    assert all(line["rotation"] < 2 for line in lines)
+
+
+def test_stream(capsys):
+    assert main(["tests/scenarios/invalid_position.txt", "wggwwg", "--stream"]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines and all(len(line["score"]) == 3 for line in lines)
+
+
+def test_stream_focus(capsys):
+    argv = ["tests/scenarios/demo_game.txt", "wggwgg", "--stream", "--focus", "5", "-5"]
+    assert main(argv + ["--backend", "serial"]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    distances = [hex_distance(line["pos"], (5, -5)) for line in lines]
+
+    # workers may finish out of order, a serial solve sends out the positions
+    # in the order it solves them
+    assert lines and distances == sorted(distances)
+
+
+def test_backends(capsys):
+    argv = ["tests/scenarios/perfect_station.txt", "s", "--top", "6"]
+    main(argv)
+    expected = capsys.readouterr().out
+
+    for backend in ["thread", "serial"]:
+        assert main(argv + ["--backend", backend, "--workers", "2"]) == 0
+        assert capsys.readouterr().out == expected
+
+    with pytest.raises(SystemExit):
+        main(argv + ["--workers", "0"])
+
+
+def test_broken_pipe():
+    # the reader goes away before the solve prints, as with a pipe into head
+    argv = ["tests/scenarios/demo_game.txt", "wggwgg", "--stream"]
+    process = subprocess.Popen(
+        [sys.executable, "-m", "dorfperfekt.cli", *argv],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    process.stdout.close()
+    assert process.wait() == 1
+    assert process.stderr.read() == b""
+    process.stderr.close()
+
+
+def test_profile(capsys):
+    argv = ["tests/scenarios/perfect_station.txt", "s", "--profile"]
+    assert main(argv + ["--backend", "serial"]) == 0
+    report = capsys.readouterr().err
+    assert report.startswith("Scored 14 positions") and "secondorder" in report
+
+
+def test_invalid_tile():
+    with pytest.raises(SystemExit):
+        main(["tests/scenarios/perfect_station.txt", "gr"])
+
+    with pytest.raises(SystemExit):
+        main(["tests/scenarios/perfect_station.txt", "s", "--top", "0"])
+
+    with pytest.raises(SystemExit):
+        main(["tests/scenarios/perfect_station.txt", "s", "--thresh", "0"])
+
+    with pytest.raises(SystemExit):
+        main(["tests/scenarios/perfect_station.txt", "s", "--top", "3", "--stream"])
+
+
+def test_invalid_mapfile(tmp_path):
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / "missing.txt"), "s"])
+
+    mapfile = tmp_path / "invalid.txt"
+    mapfile.write_text("GGGGGG 0 0\nGX 1 0\n")
+    with pytest.raises(SystemExit):
+        main([str(mapfile), "s"])
+
+    mapfile.write_text("GGGGGG 0 0\nGGGGGG 0 0\n")
+    with pytest.raises(SystemExit):
+        main([str(mapfile), "s"])
+
+    mapfile.write_bytes(b"GGGGGG 0 0\n\xff\xfe\x80 1 0\n")
+    with pytest.raises(SystemExit):
+        main([str(mapfile), "s"])
+
+
+def test_headless_imports():
+    code = "import sys, dorfperfekt.cli; print(sorted(sys.modules))"
+    modules = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert "PySide6" not in modules and "matplotlib" not in modules
@@ -0,0 +1,71 @@
+import numpy as np
+from matplotlib.figure import Figure
+
+from dorfperfekt.display import PositionMap, SpatialIndex, TerrainMap, pos2coords
+from dorfperfekt.tile import string2tile
+from dorfperfekt.tilemap import TileMap
+
+
+def make_axes(xlim, ylim):
+    ax = Figure().add_axes([0, 0, 1, 1])
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+    return ax
+
+
+def test_spatial_index():
+    positions = [(x, y) for x in range(-20, 21) for y in range(-20, 21)]
+    index = SpatialIndex()
+    for pos in positions:
+        index.add(pos)
+    index.remove((0, 0))
+
+    xlim, ylim = (-5, 12), (-3, 4)
+    expected = {
+        pos
+        for pos in positions
+        if pos != (0, 0)
+        and xlim[0] - 1 <= pos2coords(pos)[0] <= xlim[1] + 1
+        and ylim[0] - 1 <= pos2coords(pos)[1] <= ylim[1] + 1
+    }
+    assert set(index.query(xlim, ylim)) == expected
+    assert set(index.query((-1e4, 1e4), (-1e4, 1e4))) == set(positions) - {(0, 0)}
+
+
+def test_position_map():
+    ax = make_axes((-10, 10), (-10, 10))
+    position_map = PositionMap(ax)
+    position_map.draw({(0, 0), (50, 50)}, {(1, 0)}, [{(0, 1)}, {(-1, 0)}], {(0, -1)})
+    collection = position_map.collection
+    assert len(collection.get_paths()) == 5
+    assert list(position_map.rows)[:2] == [(0, 0), (1, 0)]
+    assert list(position_map.rows)[-1] == (0, -1)
+
+    # recoloring a position only touches its face color
+    paths = collection.get_paths()
+    position_map.draw({(0, 0), (50, 50)}, {(1, 0)}, [{(-1, 0)}, {(0, 1)}], {(0, -1)})
+    assert collection.get_paths() is paths
+    row = position_map.rows[(0, 1)]
+    assert np.allclose(collection.get_facecolor()[row], (1, 0, 0, 1))
+
+    x, y = pos2coords((50, 50))
+    ax.set_xlim(x - 10, x + 10)
+    ax.set_ylim(y - 10, y + 10)
+    position_map.draw({(0, 0), (50, 50)}, set())
+    assert list(position_map.rows) == [(50, 50)]
+
+
+def test_terrain_map():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    ax = make_axes((-20, 20), (-20, 20))
+    terrain_map = TerrainMap(ax)
+
+    selected = ((5, 5), string2tile("wgggrf"))
+    terrain_map.draw(list(tilemap.items()) + [selected], selected)
+    assert len(terrain_map.collection.get_paths()) == 6 * (len(tilemap) + 1)
+    assert list(terrain_map.rows)[-1] == (5, 5)
+    assert terrain_map.collection.get_edgecolor()[-1][3] == 1
+    assert terrain_map.collection.get_edgecolor()[0][3] == 0
+
+    terrain_map.draw(tilemap.items(), None)
+    assert len(terrain_map.collection.get_paths()) == 6 * len(tilemap)
@@ -0,0 +1,69 @@
+import pytest
+
+from dorfperfekt.grid import CodeGrid
+from dorfperfekt.tile import OPEN_RING, string2tile
+from dorfperfekt.tilemap import TileMap, adjacent_positions
+
+
+def test_grid_growth():
+    grid = CodeGrid()
+    grid[0, 0] = 1
+    assert grid.array.shape == (7, 7)
+
+    grid[4, -1] = 2
+    assert grid.origin == (-3, -10) and grid.array.shape == (14, 14)
+    assert grid[0, 0] == 1 and grid[4, -1] == 2
+    assert grid[1, 1] == grid[100, 100] == OPEN_RING
+
+    del grid[0, 0]
+    assert grid[0, 0] == OPEN_RING
+
+
+def test_grid_tilemap():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt", grid=True)
+    assert list(tilemap) == list(TileMap.from_file("tests/scenarios/demo_game.txt"))
+
+    del tilemap[-1, -1]
+    assert tilemap.grid[-1, -1] == OPEN_RING
+    assert all(tilemap.grid[pos] == code for pos, code in tilemap.codes.items())
+
+    positions = tilemap.open | {
+        adj for pos in tilemap.open for adj in adjacent_positions(pos)
+    }
+    positions = sorted(positions - set(tilemap))
+    rings = tilemap.grid.outer_codes(positions)
+    assert list(rings) == [tilemap.outer_code(pos) for pos in positions]
+
+    with pytest.raises(IndexError):
+        tilemap.grid.outer_codes([(100, 100)])
+
+
+def test_grid_batch_scores():
+    terrains = string2tile("wggwgg").terrains
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    gridmap = TileMap.from_file("tests/scenarios/demo_game.txt", grid=True)
+    assert gridmap.batch_scores(terrains) == tilemap.batch_scores(terrains)
+
+
+def test_grid_copy():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt", grid=True)
+    copy = tilemap.copy()
+    assert copy.grid is not None
+    assert all(copy.grid[pos] == code for pos, code in copy.codes.items())
+
+    del copy[-1, -1]
+    assert copy.grid[-1, -1] == OPEN_RING
+    assert tilemap.grid[-1, -1] == tilemap.codes[-1, -1]
+    assert all(copy.grid[pos] == code for pos, code in copy.codes.items())
+
+    # open positions that deletions left with no tile next to them
+    tilemap = TileMap(grid=True)
+    for x in range(1, 5):
+        tilemap[x, 0] = string2tile("g")
+    for x in range(1, 5):
+        del tilemap[x, 0]
+    terrains = string2tile("g").terrains
+    scores = dict(tilemap.copy().batch_scores(terrains))
+    assert scores == dict(tilemap.batch_scores(terrains))
+
+    assert TileMap.from_file("tests/scenarios/demo_game.txt").copy().grid is None
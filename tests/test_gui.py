@@ -0,0 +1,86 @@
+from dorfperfekt import gui
+from dorfperfekt.gui import BATCH_SECONDS, BATCH_SIZE, Solver
+from dorfperfekt.solver import LocalValue
+from dorfperfekt.stats import SolveStats
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class BurstyEngine:
+    # results arrive in bursts, with the workers busy in between
+    def __init__(self, clock, bursts, size, step, gap):
+        self.clock = clock
+        self.bursts, self.size, self.step, self.gap = bursts, size, step, gap
+        self.generation = LocalValue()
+        self.stats = SolveStats()
+        self.produced = self.delivered = 0
+        self.undelivered = []  # results not passed on when the engine waits
+
+    def staged_scores(self, tilemap, terrains, thresh, focus, waiting=None):
+        for burst in range(self.bursts):
+            if waiting is not None:
+                waiting()
+            self.undelivered.append(self.produced - self.delivered)
+            self.clock.now += self.gap
+            for idx in range(self.size):
+                self.clock.now += self.step
+                self.produced += 1
+                yield 3, (burst, idx), self.clock.now
+
+
+def run_bursts(monkeypatch, bursts, size, step, gap=1.0):
+    clock = FakeClock()
+    monkeypatch.setattr(gui, "time", clock)
+    solver = Solver()
+    solver.engine.close()
+    solver.engine = engine = BurstyEngine(clock, bursts, size, step, gap)
+
+    batches = []
+
+    def received(msg):
+        solve, batch = msg
+        assert solve == 1
+        engine.delivered += len(batch)
+        batches.append([clock.now - produced for _, _, produced in batch])
+
+    solver.results.connect(received)
+    solver.run((1, None, None, 1, None))
+
+    return engine, batches
+
+
+def test_solver_batches(monkeypatch):
+    # a partial batch is passed on before every wait on the workers
+    engine, batches = run_bursts(monkeypatch, bursts=4, size=100, step=0.0)
+    assert engine.undelivered == [0] * 4
+    assert engine.delivered == 400
+
+    # ...and whenever the batch is due or full
+    engine, batches = run_bursts(monkeypatch, bursts=2, size=100, step=0.01)
+    assert engine.delivered == 200
+    assert max(max(batch) for batch in batches) <= BATCH_SECONDS
+    assert len(batches) > 2
+
+    size = BATCH_SIZE + 1
+    engine, batches = run_bursts(monkeypatch, bursts=1, size=size, step=0, gap=0)
+    assert [len(batch) for batch in batches] == [BATCH_SIZE, 1]
+
+
+def test_solver_stale(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(gui, "time", clock)
+    solver = Solver()
+    solver.engine.close()
+    solver.interrupt(2)  # a newer solve was asked for while this one was queued
+    solver.engine = BurstyEngine(clock, bursts=4, size=100, step=0.0, gap=1.0)
+
+    received = []
+    solver.results.connect(received.append)
+    solver.run((1, None, None, 1, None))
+    assert not received
@@ -0,0 +1,86 @@
+import pytest
+
+from dorfperfekt.journal import Journal
+from dorfperfekt.tile import InvalidTileDefinitionError, string2tile
+from dorfperfekt.tilemap import InvalidTilePlacementError, TileMap
+
+
+def test_undo_redo():
+    tilemap = TileMap()
+    journal = Journal(tilemap)
+    journal.place((1, 0), string2tile("r"))
+    journal.place((0, 1), string2tile("d"))
+    journal.delete((1, 0))
+    assert set(tilemap) == {(0, 0), (0, 1)}
+
+    assert journal.undo() and journal.undo()
+    assert set(tilemap) == {(0, 0), (1, 0)}
+    assert journal.redo()
+    assert set(tilemap) == {(0, 0), (1, 0), (0, 1)}
+
+    journal.place((-1, 0), string2tile("f"))
+    assert not journal.redo()
+    assert journal.undo() and journal.undo() and journal.undo()
+    assert not journal.undo()
+    assert set(tilemap) == {(0, 0)}
+
+
+def test_invalid_move():
+    tilemap = TileMap()
+    journal = Journal(tilemap)
+    with pytest.raises(InvalidTilePlacementError):
+        journal.place((2, 0), string2tile("g"))
+
+    assert not journal.done and not journal.undo()
+
+
+def test_recover(tmp_path):
+    filepath = tmp_path / "map.txt.journal"
+    tilemap = TileMap()
+    with Journal(tilemap, filepath) as journal:
+        journal.place((1, 0), string2tile("r"))
+        journal.place((0, 1), string2tile("d"))
+        journal.delete((0, 0))
+        journal.undo()
+        journal.undo()
+        journal.redo()
+        journal.undo()
+
+    # the last record was cut short by a crash
+    with open(filepath, "a") as file:
+        file.write("+ GGG")
+
+    recovered = TileMap()
+    journal = Journal.recover(recovered, filepath)
+    assert recovered.tiles == tilemap.tiles
+    assert recovered.ruined == tilemap.ruined
+    assert len(journal.done) == 1 and len(journal.undone) == 2
+
+    journal.redo()
+    journal.redo()
+    journal.close()
+    assert open(filepath).read().endswith("r- GGGGGG 0 0\n")
+
+
+def test_recover_errors(tmp_path):
+    filepath = tmp_path / "map.txt.journal"
+    filepath.write_text("+ RRRRRR 1 0\n* GGGGGG 0 1\n")
+    with pytest.raises(InvalidTileDefinitionError, match="line 2"):
+        Journal.recover(TileMap(), filepath)
+
+    filepath.write_text("+ RRRRRR 1 0\n- GGGGGG 1 0\n")
+    with pytest.raises(InvalidTilePlacementError, match="line 2"):
+        Journal.recover(TileMap(), filepath)
+
+
+def test_checkpoint(tmp_path):
+    filepath = tmp_path / "map.txt.journal"
+    journal = Journal(TileMap(), filepath)
+    journal.place((1, 0), string2tile("r"))
+    assert filepath.exists()
+
+    journal.checkpoint()
+    assert not filepath.exists()
+    assert journal.undo() and filepath.read_text() == "u- RRRRRR 1 0\n"
+    journal.discard()
+    assert not filepath.exists()
@@ -2,8 +2,11 @@ import filecmp
 import os
 from collections import defaultdict
 
-from dorfperfekt.tile import string2tile
-from dorfperfekt.tilemap import TileMap
+import numpy as np
+import pytest
+
+from dorfperfekt.tile import InvalidTileDefinitionError, string2tile
+from dorfperfekt.tilemap import BINARY_FIELDS, BINARY_HEADER, BINARY_HEADERS, TileMap
 
 
 def group_scores(scores):
@@ -59,3 +62,32 @@ def test_broken_game():
     tilemap.write_file(fileout)
     assert not filecmp.cmp(filein, fileout)
     os.remove(fileout)
+
+
+def test_binary_game(tmp_path):
+    filein = "tests/scenarios/demo_game.txt"
+    fileout = tmp_path / "demo_game.dorf"
+    tilemap = TileMap.from_file(filein)
+
+    tilemap.write_file(fileout, binary=True)
+    assert TileMap.is_binary_file(fileout)
+    assert list(TileMap.from_file(fileout).tiles.items()) == list(tilemap.tiles.items())
+
+    records = np.memmap(fileout, BINARY_FIELDS, mode="r", offset=BINARY_HEADER.size)
+    assert len(records) == len(tilemap)
+    assert (records[0]["x"], records[0]["y"]) == next(iter(tilemap))
+
+    # version 1 files have no fingerprint, which is checked when present
+    body = fileout.read_bytes()[BINARY_HEADER.size :]
+    header = BINARY_HEADERS[1].pack(b"DORF", 1, 0, len(tilemap))
+    fileout.write_bytes(header + body)
+    assert TileMap.from_file(fileout).fingerprint == tilemap.fingerprint
+
+    header = BINARY_HEADER.pack(b"DORF", 2, 0, len(tilemap), tilemap.fingerprint ^ 1)
+    fileout.write_bytes(header + body)
+    with pytest.raises(InvalidTileDefinitionError, match="fingerprint"):
+        TileMap.from_file(fileout)
+
+    fileout.write_bytes(fileout.read_bytes()[:-1])
+    with pytest.raises(InvalidTileDefinitionError, match="truncated"):
+        TileMap.from_file(fileout)
@@ -0,0 +1,320 @@
+import pytest
+
+from dorfperfekt.solver import (
+    BACKENDS,
+    SolverEngine,
+    available_cpus,
+    chunked,
+    frontier_order,
+)
+from dorfperfekt.tile import string2tile
+from dorfperfekt.tilemap import TileMap, adjacent_positions, hex_distance
+
+
+def serial_scores(tilemap, terrains, thresh=1):
+    return dict(
+        tilemap.score_pos((pos, terrains, thresh)) for pos in list(tilemap.open)
+    )
+
+
+def test_engine_scores():
+    tilemap = TileMap.from_file("tests/scenarios/invalid_position.txt")
+    terrains = string2tile("wggwwg").terrains
+
+    with SolverEngine(processes=2) as engine:
+        scores = dict(engine.scores(tilemap, terrains))
+
+    assert scores == serial_scores(tilemap, terrains)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_engine_backends(backend):
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    terrains = string2tile("wggwgg").terrains
+
+    with SolverEngine(processes=2, backend=backend) as engine:
+        assert dict(engine.scores(tilemap, terrains)) == serial_scores(
+            tilemap, terrains
+        )
+
+        tilemap[-1, -4] = string2tile("ggdddg")
+        scores = engine.scores(tilemap, terrains)
+        assert dict(scores) == serial_scores(tilemap, terrains)
+        assert len(engine.ops) == 1
+
+        scores = engine.scores(tilemap, terrains)
+        next(scores)
+        engine.cancel()
+        assert not list(scores)
+
+
+def test_engine_shared_snapshot():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    terrains = string2tile("wggwgg").terrains
+
+    engine = SolverEngine(processes=2)
+    assert dict(engine.scores(tilemap, terrains)) == serial_scores(tilemap, terrains)
+    assert engine.shm.size >= tilemap.snapshot_size()
+
+    engine.close()
+    assert engine.shm is None
+
+
+@pytest.mark.parametrize("profile", [False, True])
+def test_engine_stats(profile):
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    terrains = string2tile("wggwgg").terrains
+
+    with SolverEngine(processes=2, profile=profile) as engine:
+        list(engine.staged_scores(tilemap, terrains))
+
+    stats = engine.stats
+    assert stats.counts["positions"] == stats.counts["rescored"] == len(tilemap.open)
+    assert stats.counts["rebases"] == 1
+    assert stats.times["solve"] >= stats.times["waiting on workers"] > 0
+    assert stats.summary() in stats.report()
+
+    if profile:
+        assert stats.times["scoring 3 terms"] >= stats.times["secondorder"] > 0
+        assert 0 < stats.hit_rate("alternates memo") < 1
+    else:
+        assert "secondorder" not in stats.times
+        assert stats.hit_rate("alternates memo") is None
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_engine_top_k(backend):
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    terrains = string2tile("rrfdgw").terrains
+
+    def ranked(scores):
+        return sorted(
+            (score, pos, tile.ori)
+            for pos, tilescores in scores
+            for score, tile in tilescores
+        )
+
+    with SolverEngine(processes=2, backend=backend, profile=True) as engine:
+        full = ranked(engine.scores(tilemap, terrains))
+        for top_k in [1, 10]:
+            bounded = ranked(engine.scores(tilemap, terrains, top_k=top_k))
+            assert bounded[:top_k] == full[:top_k]
+            assert len(bounded) == len(full)
+            assert engine.stats.counts["pruned at 1 terms"] > 0
+
+        # the repeated orientations of a symmetric tile are not counted apart
+        terrains = string2tile("gfgfgf").terrains
+        full = ranked(engine.scores(tilemap, terrains))
+        full = [placement for placement in full if placement[2] < 2]
+        bounded = ranked(engine.scores(tilemap, terrains, top_k=5))
+        bounded = [placement for placement in bounded if placement[2] < 2]
+        assert bounded[:5] == full[:5]
+
+        with pytest.raises(ValueError):
+            next(engine.scores(tilemap, terrains, top_k=0))
+
+
+def test_engine_workers():
+    assert available_cpus() >= 1
+    assert SolverEngine(backend="serial").processes == 1
+    with pytest.raises(ValueError):
+        SolverEngine(backend="gpu")
+
+
+def test_engine_deltas():
+    tilemap = TileMap.from_file("tests/scenarios/perfect_station.txt")
+    terrains = string2tile("s").terrains
+
+    with SolverEngine(processes=2) as engine:
+        list(engine.scores(tilemap, terrains))
+        pool = engine.pool
+
+        tilemap[2, -1] = string2tile("s")
+        del tilemap[3, -2]
+        tilemap[3, -2] = string2tile("c")
+        scores = dict(engine.scores(tilemap, terrains))
+
+        assert engine.pool is pool
+        assert len(engine.ops) == 3
+        assert scores == serial_scores(tilemap, terrains)
+
+        # a copy of the map syncs by its deltas as well
+        copy = tilemap.copy()
+        del copy[2, -1]
+        scores = dict(engine.scores(copy, terrains))
+        assert engine.pool is pool
+        assert len(engine.ops) == 4
+        assert scores == serial_scores(copy, terrains)
+
+
+def test_engine_stranded():
+    tilemap = TileMap()
+    terrains = string2tile("wggwgg").terrains
+
+    with SolverEngine(processes=2) as engine:
+        list(engine.scores(tilemap, terrains))
+        pool = engine.pool
+
+        # deletions leave (2, 0) open with no tile next to it
+        tilemap[1, 0] = string2tile("g")
+        tilemap[2, 0] = string2tile("g")
+        del tilemap[1, 0]
+        del tilemap[2, 0]
+        scores = dict(engine.scores(tilemap, terrains))
+        assert engine.pool is pool
+        assert scores == serial_scores(tilemap, terrains)
+        assert scores[2, 0]
+
+        tilemap[2, 0] = string2tile("g")
+        scores = dict(engine.scores(tilemap, terrains))
+        assert engine.pool is pool
+        assert scores == serial_scores(tilemap, terrains)
+
+
+def test_engine_rebase():
+    tilemap1 = TileMap()
+    tilemap2 = TileMap.from_file("tests/scenarios/perfect_station.txt")
+    terrains = string2tile("s").terrains
+
+    with SolverEngine(processes=1, max_ops=1) as engine:
+        list(engine.scores(tilemap1, terrains))
+        pool = engine.pool
+
+        scores = dict(engine.scores(tilemap2, terrains))
+        assert engine.pool is not pool
+        assert scores == serial_scores(tilemap2, terrains)
+
+        # too many deltas since the pool started
+        pool = engine.pool
+        tilemap2[2, -1] = string2tile("s")
+        tilemap2[1, 1] = string2tile("g")
+        scores = dict(engine.scores(tilemap2, terrains))
+        assert engine.pool is not pool
+        assert scores == serial_scores(tilemap2, terrains)
+
+
+def test_engine_abandoned():
+    tilemap = TileMap()
+    terrains = string2tile("r").terrains
+
+    with SolverEngine(processes=1) as engine:
+        scores = engine.scores(tilemap, terrains)
+        next(scores)
+        pool, generation = engine.pool, engine.generation.value
+        scores.close()
+        assert engine.generation.value == generation + 1
+
+        assert len(list(engine.scores(tilemap, terrains))) == len(tilemap.open)
+        assert engine.pool is pool
+
+
+def test_engine_cancel():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    terrains = string2tile("wggwgg").terrains
+
+    with SolverEngine(processes=1) as engine:
+        scores = engine.scores(tilemap, terrains)
+        next(scores)
+        engine.cancel()
+        assert not list(scores)
+
+        assert dict(engine.scores(tilemap, terrains)) == serial_scores(
+            tilemap, terrains
+        )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_engine_closed(backend):
+    tilemap1 = TileMap.from_file("tests/scenarios/demo_game.txt")
+    tilemap2 = TileMap()
+    terrains = string2tile("wggwgg").terrains
+    serial = serial_scores(tilemap1, terrains)
+
+    # solves on replicas that have since moved on or closed end, and do not hang
+    with SolverEngine(processes=2, backend=backend) as engine:
+        scores1 = engine.scores(tilemap1, terrains)
+        scores2 = engine.scores(tilemap2, terrains)
+        scores = dict([next(scores1)])
+        assert dict([next(scores2), *scores2]) == serial_scores(tilemap2, terrains)
+        scores.update(scores1)
+        assert all(serial[pos] == tilescores for pos, tilescores in scores.items())
+
+        scores1 = engine.scores(tilemap1, terrains)
+        next(scores1)
+    assert not list(scores1)
+
+
+def test_engine_staged():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    terrains = string2tile("wggwgg").terrains
+    serial = serial_scores(tilemap, terrains)
+
+    with SolverEngine(processes=2) as engine:
+        stages = [terms for terms, _, _ in engine.staged_scores(tilemap, terrains)]
+        assert stages == sorted(stages)
+        assert stages.count(1) == stages.count(3) == len(tilemap.open)
+
+        for terms, pos, tilescores in engine.staged_scores(tilemap, terrains):
+            assert tilescores == {(score[:terms], tile) for score, tile in serial[pos]}
+
+        # called before syncing, and before every chunk awaited in each stage
+        waits = []
+        list(engine.staged_scores(tilemap, terrains, waiting=lambda: waits.append(1)))
+        assert len(waits) == 1 + 3 * (engine.stats.counts["chunks"] // 3 + 1)
+
+
+def test_engine_incremental():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    terrains = string2tile("wggwgg").terrains
+
+    with SolverEngine(processes=1, incremental=True) as engine:
+        list(engine.scores(tilemap, terrains))
+        assert len(engine.rescored) == len(tilemap.open)
+
+        scores = dict(engine.scores(tilemap, terrains))
+        assert not engine.rescored
+        assert scores == serial_scores(tilemap, terrains)
+
+        tilemap[-1, -4] = string2tile("ggdddg")
+        scores = dict(engine.scores(tilemap, terrains, thresh=2))
+        assert len(engine.rescored) == len(tilemap.open)
+        assert scores == serial_scores(tilemap, terrains, thresh=2)
+
+        scores = dict(engine.scores(tilemap, terrains))
+        assert 0 < len(engine.rescored) < len(tilemap.open)
+        assert scores == serial_scores(tilemap, terrains)
+
+        del tilemap[-1, -4]
+        scores = dict(engine.scores(tilemap, terrains, thresh=2))
+        assert 0 < len(engine.rescored) < len(tilemap.open)
+        assert scores == serial_scores(tilemap, terrains, thresh=2)
+
+
+def test_chunked():
+    positions = list(range(100))
+    chunks = chunked(positions, processes=2)
+    assert [pos for chunk in chunks for pos in chunk] == positions
+    assert [len(chunk) for chunk in chunks[:4]] == [1, 2, 4, 8]
+    assert len(chunks[-1]) == 1
+
+
+def test_frontier_order():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+
+    ordered = frontier_order(tilemap, tilemap.open, focus=(5, -5))
+    distances = [hex_distance(pos, (5, -5)) for pos in ordered]
+    assert distances == sorted(distances)
+
+    ordered = frontier_order(tilemap, tilemap.open)
+    assert sorted(ordered) == sorted(tilemap.open)
+    enclosure = [
+        sum([adj in tilemap for adj in adjacent_positions(pos)]) for pos in ordered
+    ]
+    assert enclosure == sorted(enclosure, reverse=True)
+
+    terrains = string2tile("wggwgg").terrains
+    with SolverEngine(processes=1) as engine:
+        scores = list(engine.scores(tilemap, terrains, focus=(5, -5)))
+
+    assert [pos for pos, _ in scores] == frontier_order(tilemap, tilemap.open, (5, -5))
+    assert dict(scores) == serial_scores(tilemap, terrains)
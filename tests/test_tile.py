@@ -1,10 +1,25 @@
 import pytest
 
 from dorfperfekt.tile import (
+    TERRAIN_CODES,
     InvalidTileDefinitionError,
     Terrain,
+    canonical_code,
+    code2string,
+    code2terrains,
+    code2tile,
+    fits_perfectly,
+    perfect_terrains,
+    placements,
+    ring_terrains,
+    rotate_code,
+    rotational_period,
+    string2code,
     string2tile,
+    terrains2code,
+    tile2code,
     tile2string,
+    validate_codes,
     validate_terrains,
     validate_tiles,
 )
@@ -55,3 +70,56 @@ def test_validate_tiles():
 
     valid, perfect = validate_tiles(string2tile("dwwggr"), string2tile("dcwrog"))
     assert valid and perfect == (True, True, True, False, None, False)
+
+
+def test_codes():
+    tile = string2tile("frdwtg")
+    code = tile2code(tile)
+    assert code2string(code) == "FRDWTG"
+    assert string2code("frdwtg") == code
+    assert code2tile(code) == tile
+    assert code2terrains(code) == tuple(Terrain(t) for t in "FRDWTG")
+
+    assert code2string(rotate_code(code, 1)) == "GFRDWT"
+    assert code2string(rotate_code(code, -1)) == "RDWTGF"
+    assert canonical_code(code) == (terrains2code(tile.terrains), tile.ori)
+
+
+def test_validate_codes():
+    valid, imperfect = validate_codes(string2code("dwwggr"), string2code("cwrogd"))
+    assert not valid and imperfect is None
+
+    valid, imperfect = validate_codes(string2code("dwwggr"), string2code("dcwrog"))
+    assert valid and imperfect == 0b101000
+
+
+def test_placements():
+    outer = string2code("wooooo")
+    assert placements(outer, string2code("wggggg")) == ((0, 0),)
+    assert placements(outer, string2code("gwgggg")) == ((5, 0),)
+    assert not placements(outer, string2code("r"))
+
+    outer = string2code("gooooo")
+    assert fits_perfectly(outer, string2code("wggggg"))
+    assert not fits_perfectly(outer, string2code("r"))
+
+    # symmetric orientations are listed once
+    assert placements(outer, string2code("g")) == ((0, 0),)
+    assert placements(outer, string2code("gfgfgf")) == ((0, 0), (1, 0b000001))
+
+
+def test_perfect_terrains():
+    grass, water, coast, station = [
+        TERRAIN_CODES[Terrain(t)] for t in ["G", "W", "C", "S"]
+    ]
+    assert perfect_terrains(string2code("w")) == {water, coast, station}
+    assert grass in perfect_terrains(string2code("wggggg"))
+    assert ring_terrains(string2code("wooooo")) == {water}
+
+
+def test_rotational_period():
+    assert rotational_period(string2code("g")) == 1
+    assert rotational_period(string2code("gfgfgf")) == 2
+    assert rotational_period(string2code("wggwgg")) == 3
+    assert rotational_period(rotate_code(string2code("wggwgg"), 1)) == 3
+    assert rotational_period(string2code("wggggg")) == 6
@@ -1,8 +1,17 @@
+import os
+import subprocess
+import sys
 from collections import defaultdict
 
 import pytest
 
-from dorfperfekt.tile import string2tile, tile2string
+from dorfperfekt.tile import (
+    InvalidTileDefinitionError,
+    fits_perfectly,
+    perfect_terrains,
+    string2tile,
+    tile2string,
+)
 from dorfperfekt.tilemap import InvalidTilePlacementError, TileMap
 
 
@@ -109,6 +118,27 @@ def test_score():
     with pytest.raises(InvalidTilePlacementError):
         tilemap.score_tile(pos=(1, 0), tile=string2tile("t"))
 
+    # every orientation of a symmetric tile is listed, scored once
+    _, scores = tilemap.score_pos(((1, 0), string2tile("gfgfgf").terrains, 1))
+    assert sorted(tile.ori for _, tile in scores) == list(range(6))
+    for ori in range(2):
+        assert len({score for score, tile in scores if tile.ori % 2 == ori}) == 1
+
+    # scored only as far as needed to tell it is worse than the bound
+    tile = string2tile("r")
+    assert tilemap.score_tile((1, 0), tile, bound=(1, 0, 0)) == (2,)
+    assert tilemap.score_tile((1, 0), tile, bound=(2, 0, 0)) == (2, 1)
+    assert tilemap.score_tile((1, 0), tile, bound=(2, 1, -5)) == (2, 1, 0)
+
+    # scoring leaves open positions that no tile touches open
+    tilemap[1, 0] = string2tile("g")
+    tilemap[2, 0] = string2tile("g")
+    del tilemap[1, 0]
+    del tilemap[2, 0]
+    opened = set(tilemap.open)
+    tilemap.score_tile(pos=(1, 0), tile=string2tile("g"))
+    assert tilemap.open == opened
+
 
 def test_scores():
     tilemap = TileMap()
@@ -126,3 +156,180 @@ def test_scores():
 
     scores = tilemap.scores(string2tile("ffgfff").terrains)
     assert ((-1, 0), string2tile("gfffff")) in group_scores(scores)[0]
+
+
+def test_ruined_counts():
+    tilemap = TileMap()
+    tilemap[1, 0] = string2tile("r")
+    tilemap[0, 1] = string2tile("f")
+    assert tilemap.ruined == {(0, 0): 2, (1, 0): 2, (0, 1): 2}
+
+    del tilemap[1, 0]
+    assert tilemap.ruined == {(0, 0): 1, (0, 1): 1}
+
+    del tilemap[0, 1]
+    assert not tilemap.ruined
+
+
+def test_alternates_memo():
+    tilemap = TileMap()
+    tilemap[1, 0] = string2tile("gggggw")
+    fingerprint = tilemap.counter_fingerprint
+    alternates = tilemap.perfect_alternates((2, 0))
+    assert len(tilemap.memo) == 1
+
+    tilemap.score_tile(pos=(-1, 0), tile=string2tile("r"))
+    assert tilemap.counter_fingerprint == fingerprint
+    assert tilemap.perfect_alternates((2, 0)) == alternates
+
+    tilemap[-1, 0] = string2tile("gggggw")
+    assert tilemap.counter_fingerprint != fingerprint
+    assert tilemap.perfect_alternates((2, 0)) == alternates + 1
+
+    del tilemap[-1, 0]
+    assert tilemap.counter_fingerprint == fingerprint
+
+
+def test_fingerprint():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    fingerprint = tilemap.fingerprint
+    counter_fingerprint = tilemap.counter_fingerprint
+
+    tile = tilemap[-1, -1]
+    del tilemap[-1, -1]
+    assert tilemap.fingerprint != fingerprint
+    assert tilemap.counter_fingerprint != counter_fingerprint
+
+    tilemap[-1, -1] = tile
+    assert tilemap.fingerprint == fingerprint
+    assert tilemap.counter_fingerprint == counter_fingerprint
+
+    # the same tiles elsewhere only share the counter fingerprint
+    moved = TileMap.from_tiles([((0, 0), string2tile("r")), ((1, 0), tile)])
+    other = TileMap.from_tiles([((0, 0), string2tile("r")), ((0, 1), tile)])
+    assert moved.fingerprint != other.fingerprint
+    assert moved.counter_fingerprint == other.counter_fingerprint
+
+    # fingerprints do not depend on the hash seed of the process
+    code = "from dorfperfekt.tilemap import TileMap; "
+    code += "t = TileMap.from_file('tests/scenarios/demo_game.txt'); "
+    code += "print(t.fingerprint, t.counter_fingerprint)"
+    env = dict(os.environ, PYTHONHASHSEED="1234")
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    assert output.split() == [
+        str(fingerprint).encode(),
+        str(counter_fingerprint).encode(),
+    ]
+
+
+def test_fitting_index():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+
+    def indexed(tilemap):
+        return {terrain: kinds for terrain, kinds in tilemap.fitting.items() if kinds}
+
+    def expected(tilemap):
+        fitting = defaultdict(set)
+        for kind in tilemap.kinds:
+            for terrain in perfect_terrains(kind):
+                fitting[terrain].add(kind)
+        return fitting
+
+    assert indexed(tilemap) == expected(tilemap)
+    for pos in [(-1, -1), (0, 0)]:
+        del tilemap[pos]
+    assert indexed(tilemap) == expected(tilemap)
+
+    # the candidates of a ring are a superset of the kinds fitting it perfectly
+    for pos in tilemap.open:
+        outer = tilemap.outer_code(pos)
+        fits = {kind for kind in tilemap.kinds if fits_perfectly(outer, kind)}
+        assert fits <= tilemap.candidate_kinds(outer)
+
+
+def test_light_imports():
+    code = "import sys, dorfperfekt.tilemap; print(*sys.modules)"
+    modules = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.split()
+
+    heavy = ("multiprocessing", "numpy", "matplotlib", "PySide6")
+    assert not [module for module in modules if module.startswith(heavy)]
+
+
+def test_from_file_errors(tmp_path):
+    def load(*lines):
+        filepath = tmp_path / "map.txt"
+        filepath.write_text("\n".join(lines) + "\n")
+        return TileMap.from_file(filepath)
+
+    with pytest.raises(InvalidTileDefinitionError, match="line 2"):
+        load("GGGGGG 0 0", "GGGGG 1 0")
+
+    with pytest.raises(InvalidTilePlacementError, match="line 3"):
+        load("GGGGGG 0 0", "GGGGGG 1 0", "RRRRRR 0 0")
+
+    with pytest.raises(InvalidTilePlacementError, match="line 2"):
+        load("GGGGGG 0 0", "GGGGGG 2 0")
+
+    with pytest.raises(InvalidTilePlacementError, match="line 1"):
+        load("TTTTTT 1 0", "GGGGGG 0 0")
+
+    tilemap = load("GGGGGG -1 0", "", "GGGGGG 0 0", "RRRRRR 1 0")
+    assert list(tilemap) == [(0, 0), (1, 0), (-1, 0)]
+
+    filepath = tmp_path / "map.txt"
+    filepath.write_bytes(b"GGGGGG 0 0\r\nGGGGGG 1 0\r\n")
+    assert list(TileMap.from_file(filepath)) == [(0, 0), (1, 0)]
+
+    filepath.write_bytes(b"GGGGGG 0 0\n\xff\xfe\x80 1 0\n")
+    with pytest.raises(InvalidTileDefinitionError, match="line 2"):
+        TileMap.from_file(filepath)
+
+
+def test_snapshot():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    del tilemap[-1, -1]
+    buffer = bytearray(tilemap.snapshot_size())
+    tilemap.write_snapshot(buffer)
+
+    snapshot = TileMap.from_snapshot(buffer)
+    assert list(snapshot.tiles.items()) == list(tilemap.tiles.items())
+    assert snapshot.codes == tilemap.codes
+    assert snapshot.counter == tilemap.counter
+    assert snapshot.kinds == tilemap.kinds
+    assert snapshot.counter_fingerprint == tilemap.counter_fingerprint
+    assert snapshot.fingerprint == tilemap.fingerprint
+    assert snapshot.fitting == tilemap.fitting
+    assert snapshot.ruined == tilemap.ruined
+    assert snapshot.open == tilemap.open
+
+    # deletions may leave open positions that no tile touches
+    tilemap = TileMap()
+    tilemap[1, 0] = string2tile("g")
+    tilemap[2, 0] = string2tile("g")
+    del tilemap[1, 0]
+    del tilemap[2, 0]
+    buffer = bytearray(tilemap.snapshot_size())
+    tilemap.write_snapshot(buffer)
+    assert (2, 0) in tilemap.open
+    assert TileMap.from_snapshot(buffer).open == tilemap.open
+
+
+def test_copy():
+    tilemap = TileMap.from_file("tests/scenarios/demo_game.txt")
+    copy = tilemap.copy()
+    assert list(copy.tiles.items()) == list(tilemap.tiles.items())
+    assert copy.fingerprint == tilemap.fingerprint
+
+    # changes to the map leave the copy as it was
+    del tilemap[-1, -1]
+    assert (-1, -1) in copy
+    assert copy.fingerprint != tilemap.fingerprint
+
+    tilemap = TileMap()
+    tilemap[1, 0] = string2tile("g")
+    tilemap[2, 0] = string2tile("g")
+    del tilemap[1, 0]
+    del tilemap[2, 0]
+    assert tilemap.copy().open == tilemap.open